@@ -0,0 +1,110 @@
+"""
+Claims per second and score parity of the embedding backends
+
+    python benchmarks/embedding_backends.py [--backends torch,torch-int8]
+        [--threads N] [--rounds 3] [--tolerance 0.02]
+
+The workload is the claims and titles of similarity_threshold_exp.txt plus
+the snippets of saved ScaleSERP responses, scored the way draft.py does:
+all claims at once through an EmbeddingBatcher. Scores of every backend are
+compared with torch, and the run exits non-zero if one differs by more
+than --tolerance or selects other snippets at the draft.py threshold and
+top n. This is a benchmark run by hand; the assertion-based parity check is
+tests/test_embedding_backends.py
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import numpy as np
+
+from delphai_scraper_utils.batching import EmbeddingBatcher
+from delphai_scraper_utils.embeddings import BACKENDS, get_model
+from delphai_scraper_utils.relevancy import score_batch, select_top, snippet_text
+from delphai_scraper_utils.serp import parse_serp
+from relevancy_threshold import DEFAULT_EXPERIMENT, DEFAULT_RESPONSES, parse_experiment
+
+# draft.py
+SIMILARITY_THRESHOLD = 0.6
+TOP_N = 15
+
+
+def load_workload(experiment, responses):
+    """
+    [(claim, [text, ...]), ...]
+    """
+    workload = [
+        (claim, [title for title, _ in titles])
+        for claim, titles in parse_experiment(experiment)
+    ]
+    for path in responses:
+        with open(path, encoding="utf-8") as f:
+            parsed = parse_serp(json.load(f))
+        workload.append(
+            (parsed.query, [snippet_text(snippet) for snippet in parsed.snippets])
+        )
+    return workload
+
+
+async def score_concurrently(workload, model):
+    batcher = EmbeddingBatcher(model=model)
+
+    async def score(claim, texts):
+        embeddings = await batcher.encode([claim] + texts)
+        return embeddings[1:] @ embeddings[0]
+
+    return await asyncio.gather(*(score(claim, texts) for claim, texts in workload))
+
+
+def benchmark(workload, model, rounds):
+    asyncio.run(score_concurrently(workload, model))
+    started = time.perf_counter()
+    for _ in range(rounds):
+        scores = asyncio.run(score_concurrently(workload, model))
+    elapsed = time.perf_counter() - started
+    return scores, len(workload) * rounds / elapsed
+
+
+def main(args):
+    workload = load_workload(args.experiment, args.responses)
+    reference = score_batch(
+        [claim for claim, _ in workload],
+        [texts for _, texts in workload],
+        model=get_model(backend="torch", threads=args.threads),
+    )
+    texts = sum(len(texts) for _, texts in workload)
+    print(f"{len(workload)} claims, {texts} texts, {args.threads or 'default'} threads")
+    print(f"{'backend':>12} {'claims/s':>9} {'max diff':>9} {'same top':>9}")
+
+    failed = False
+    for backend in args.backends.split(","):
+        model = get_model(backend=backend, threads=args.threads)
+        scores, claims_per_second = benchmark(workload, model, args.rounds)
+        difference = max(
+            (np.abs(ours - theirs).max() for ours, theirs in zip(scores, reference)),
+            default=0.0,
+        )
+        same_top = sum(
+            set(select_top(ours, SIMILARITY_THRESHOLD, TOP_N).tolist())
+            == set(select_top(theirs, SIMILARITY_THRESHOLD, TOP_N).tolist())
+            for ours, theirs in zip(scores, reference)
+        )
+        print(
+            f"{backend:>12} {claims_per_second:>9.1f} {difference:>9.4f} "
+            f"{same_top:>4}/{len(workload):<4}"
+        )
+        failed |= difference > args.tolerance or same_top < len(workload)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.02)
+    parser.add_argument("--experiment", default=DEFAULT_EXPERIMENT)
+    parser.add_argument("--responses", nargs="*", default=DEFAULT_RESPONSES)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""
+Line normalisation of extractor output before and after memoised cleaning
+
+    python benchmarks/formatting.py [page.html ...]
+
+Runs trafilatura and goose on every page once, then times formatting() on
+both outputs of all pages: the previous per-line implementation, the
+current one starting from an empty clean_text cache, and the current one
+with the cache already holding the lines. Fails if the outputs differ
+"""
+import glob
+import re
+import sys
+import timeit
+
+import trafilatura
+from cleantext import clean
+
+from delphai_scraper_utils import deboilerplating
+from delphai_scraper_utils.deboilerplating import clean_text, formatting
+
+DEFAULT_PAGES = sorted(glob.glob("exp_article_html/*.html"))
+
+
+# deboilerplating.clean_text and formatting before memoisation, verbatim
+def legacy_clean_text(text: str):
+    return clean(text, fix_unicode=True, to_ascii=False, lower=False, no_emoji=True)
+
+
+def legacy_formatting(text: str):
+    text = re.sub(r"\n+", "\n", text).strip()
+    list_sentences = text.split("\n")
+    list_sentences = [legacy_clean_text(sentence) for sentence in list_sentences]
+    if list_sentences == [""]:
+        list_sentences = []
+    return list_sentences
+
+
+def raw_outputs(paths):
+    deboilerplating.init_extractors()
+    outputs = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            html = f.read()
+        traf = trafilatura.extract(
+            html,
+            no_fallback=False,
+            include_comments=False,
+            include_tables=True,
+            include_formatting=False,
+        )
+        goose = deboilerplating.goose.extract(raw_html=html).cleaned_text
+        outputs.extend(text for text in (traf, goose) if text)
+    return outputs
+
+
+def main(paths):
+    outputs = raw_outputs(paths)
+    lines = sum(text.count("\n") + 1 for text in outputs)
+    print(f"{len(paths)} pages, {len(outputs)} extractor outputs, {lines} lines")
+
+    clean_text.cache_clear()
+    if [formatting(text) for text in outputs] != [
+        legacy_formatting(text) for text in outputs
+    ]:
+        print("formatting output differs from the previous implementation")
+        return 1
+    print(f"clean_text cache: {clean_text.cache_info()}")
+
+    def cold():
+        clean_text.cache_clear()
+        return [formatting(text) for text in outputs]
+
+    cases = {
+        "before": lambda: [legacy_formatting(text) for text in outputs],
+        "after, cold": cold,
+        "after, warm": lambda: [formatting(text) for text in outputs],
+    }
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=1, repeat=5))
+        print(f"{name:>12} {seconds * 1e3:>9.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:] or DEFAULT_PAGES))
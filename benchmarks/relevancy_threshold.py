@@ -0,0 +1,117 @@
+"""
+Reproduces the title similarity experiment in similarity_threshold_exp.txt
+and measures the lexical prefilter and title + snippet scoring
+
+    python benchmarks/relevancy_threshold.py [experiment.txt] [response.json ...]
+
+For every band of titles recorded in the experiment ("(ss: 0.7)" closes the
+titles scoring at least 0.7) it reports how many titles the current model
+still puts in that band, and how many of them the BM25 prefilter would keep.
+Saved ScaleSERP responses are ranked by title only and by title + snippet
+"""
+import json
+import re
+import sys
+import time
+
+import numpy as np
+
+from delphai_scraper_utils.embeddings import get_model
+from delphai_scraper_utils.relevancy import bm25_scores, score_batch, snippet_text
+from delphai_scraper_utils.serp import parse_serp
+
+DEFAULT_EXPERIMENT = "similarity_threshold_exp.txt"
+DEFAULT_RESPONSES = ["output/api_call_output.json"]
+BAND = re.compile(r"\(ss:\s*([\d.]+)\)")
+
+
+def parse_experiment(path):
+    """
+    [(claim, [(title, band), ...]), ...]
+    """
+    claims = []
+    titles = []
+    for line in open(path, encoding="utf-8"):
+        line = line.strip()
+        if line.startswith("claim:"):
+            titles = []
+            claims.append((line[len("claim:") :].strip(), []))
+        elif line.startswith("-"):
+            titles.append(line[1:].strip())
+        else:
+            match = BAND.search(line)
+            if match and claims:
+                band = float(match.group(1))
+                claims[-1][1].extend((title, band) for title in titles)
+                titles = []
+    return claims
+
+
+def reproduce(experiment, model):
+    claims = parse_experiment(experiment)
+    started = time.perf_counter()
+    all_scores = score_batch(
+        [claim for claim, _ in claims],
+        [[title for title, _ in titles] for _, titles in claims],
+        model=model,
+    )
+    encode_seconds = time.perf_counter() - started
+
+    rows = {}
+    lexical_seconds = 0.0
+    for (claim, titles), scores in zip(claims, all_scores):
+        started = time.perf_counter()
+        lexical = bm25_scores(claim, [title for title, _ in titles])
+        lexical_seconds += time.perf_counter() - started
+        bands = {band for _, band in titles}
+        for (title, band), score, kept in zip(titles, scores, lexical > 0):
+            # a band runs up to the next higher one, the top band is open
+            upper = min((other for other in bands if other > band), default=np.inf)
+            row = rows.setdefault(band, dict(titles=0, in_band=0, kept=0))
+            row["titles"] += 1
+            row["in_band"] += int(band <= score < upper)
+            row["kept"] += int(kept)
+
+    print(f"{experiment}: {len(claims)} claims")
+    print(f"{'band':>6} {'titles':>7} {'in band':>8} {'prefilter kept':>15}")
+    for band in sorted(rows, reverse=True):
+        row = rows[band]
+        print(
+            f"{band:>6.1f} {row['titles']:>7} {row['in_band']:>8} "
+            f"{row['kept']:>15}"
+        )
+    print(f"encode {encode_seconds * 1e3:.1f} ms, bm25 {lexical_seconds * 1e3:.2f} ms")
+
+
+def compare_fields(paths, model):
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            parsed = parse_serp(json.load(f))
+        snippets = parsed.snippets
+        title_scores, text_scores = score_batch(
+            [parsed.query, parsed.query],
+            [
+                [snippet_text(snippet, "title") for snippet in snippets],
+                [snippet_text(snippet) for snippet in snippets],
+            ],
+            model=model,
+        )
+        lexical = bm25_scores(parsed.query, [snippet_text(s) for s in snippets])
+        print(f"\n{path}: {parsed.query}")
+        print(f"{'title':>6} {'+text':>6} {'bm25':>6}  title")
+        for index in np.argsort(-text_scores, kind="stable"):
+            print(
+                f"{title_scores[index]:>6.2f} {text_scores[index]:>6.2f} "
+                f"{lexical[index]:>6.2f}  {snippets[index].title}"
+            )
+
+
+def main(args):
+    experiment = args[0] if args else DEFAULT_EXPERIMENT
+    model = get_model()
+    reproduce(experiment, model)
+    compare_fields(args[1:] or DEFAULT_RESPONSES, model)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,79 @@
+"""
+Sentence segmentation throughput on the saved article pages
+
+    python benchmarks/segmentation.py [page.html ...]
+
+Extracts the text of every page once, then times nltk.sent_tokenize (what
+extraction used before), segment() with the shared Punkt tokenizer, the
+same fed line by line through SentenceSegmenter, and the rule-based
+segmenter. Agreement is the share of Punkt sentences a method reproduces
+exactly
+"""
+
+import glob
+import sys
+import timeit
+from collections import Counter
+
+from nltk.tokenize import sent_tokenize
+
+from delphai_scraper_utils.extraction import extract_article
+from delphai_scraper_utils.segmentation import (
+    add_nltk_data_path,
+    iter_sentences,
+    segment,
+    split_rules,
+)
+
+DEFAULT_PAGES = sorted(glob.glob("exp_article_html/*.html"))
+
+
+def by_line(text):
+    return list(iter_sentences(line + "\n" for line in text.split("\n")))
+
+
+METHODS = {
+    "sent_tokenize": sent_tokenize,
+    "punkt": segment,
+    "punkt by line": by_line,
+    "rules": split_rules,
+}
+
+
+def main(paths):
+    add_nltk_data_path()
+    texts = []
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = extract_article(f.read(), "https://example.com/")
+        if text:
+            texts.append(text)
+    chars = sum(map(len, texts))
+    print(f"{len(texts)} articles, {chars} chars")
+
+    reference = [segment(text) for text in texts]
+    print(f"{'method':>14} {'ms':>8} {'MB/s':>6} {'sentences':>10} {'agreement':>10}")
+    for name, method in METHODS.items():
+        runs = 5
+        seconds = (
+            min(
+                timeit.repeat(
+                    lambda: [method(text) for text in texts], number=runs, repeat=3
+                )
+            )
+            / runs
+        )
+        output = [method(text) for text in texts]
+        sentences = sum(map(len, output))
+        agreement = sum(
+            sum((Counter(ours) & Counter(punkt)).values())
+            for ours, punkt in zip(output, reference)
+        ) / max(1, sum(map(len, reference)))
+        print(
+            f"{name:>14} {seconds * 1e3:>8.2f} {chars / seconds / 1e6:>6.2f} "
+            f"{sentences:>10} {agreement:>10.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or DEFAULT_PAGES)
@@ -0,0 +1,146 @@
+"""
+Micro-benchmark of the ScaleSERP snippet parser against saved responses
+
+    python benchmarks/serp_parse.py [response.json ...]
+
+Compares parse_serp with the get_maybe-based parser it replaced and checks
+that both produce the same snippets
+"""
+import json
+import logging
+import sys
+import timeit
+
+from delphai_scraper_utils.serp import parse_serp
+from delphai_scraper_utils.utils import get_maybe
+
+DEFAULT_RESPONSES = ["output/api_call_output.json"]
+
+
+# draft.get_snippets before parse_serp, verbatim
+def legacy_get_snippets(response):
+    query = get_maybe(["search_parameters", "q"], response)
+    if not query.success:
+        logging.info("ERROR getting snippets")
+        return []
+    snippets = []
+    for item in response.get("organic_results", []):
+        snippet = item.get("snippet")
+        title = item.get("title")
+        link = item.get("link")
+        if snippet:
+            snippets.append(
+                dict(
+                    snippet=snippet,
+                    link=link,
+                    title=title,
+                    date=item.get("date"), #
+                    domain=item.get("domain"), #
+                    query=query.value,
+                    src="organic_results",
+                )
+            )
+
+        for nr in get_maybe(["nested_results"], item, []).value:
+            snippet = nr.get("snippet")
+            title = item.get("title")
+            link = nr.get("link")
+
+            if snippet:
+                snippets.append(
+                    dict(
+                        snippet=snippet,
+                        link=link,
+                        title=title,
+                        date=item.get("date"), #
+                        domain=item.get("domain"), #
+                        query=query.value,
+                        src="nested_results",
+                    )
+                )
+        snippet = get_maybe(["rich_snippet", "top", "extensions"], item)
+        if snippet.success:
+            title = item.get("title")
+            link = item.get("link")
+
+            snippets.append(
+                dict(
+                    snippet=" ".join(snippet.value),
+                    link=link,
+                    title=title,
+                    date=item.get("date"), #
+                    domain=item.get("domain"), #
+                    query=query.value,
+                    src="rich_snippet/extensions",
+                )
+            )
+
+        snippet = get_maybe(["rich_snippet", "top", "attributes_flat"], item)
+        if snippet.success:
+            title = item.get("title")
+            link = item.get("link")
+
+            snippets.append(
+                dict(
+                    snippet=item["rich_snippet"]["top"]["attributes_flat"],
+                    link=link,
+                    title=title,
+                    date=item.get("date"), #
+                    domain=item.get("domain"), #
+                    #title=query.value,
+                    query=query.value,
+                    src="rich_snippet/attributes_flat",
+                )
+            )
+
+            for faq_item in get_maybe(["faq"], item, []).value:
+                snippet = get_maybe(["answer"], faq_item)
+                title = item.get("title")
+                link = item.get("link")
+
+                if snippet.success:
+                    snippets.append(
+                        dict(
+                            snippet=snippet.value,
+                            link=link,
+                            title=title,
+                            date=item.get("date"), #
+                            domain=item.get("domain"), #
+                            #title=query.value,
+                            query=query.value,
+                            src="faq",
+                        )
+                    )
+    return snippets
+
+
+def main(paths):
+    responses = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            responses.append(json.load(f))
+
+    for response in responses:
+        legacy = legacy_get_snippets(response)
+        parsed = [snippet.to_dict() for snippet in parse_serp(response).snippets]
+        assert parsed == legacy, "parse_serp differs from the legacy parser"
+
+    snippets = sum(len(legacy_get_snippets(response)) for response in responses)
+    print(f"{len(responses)} responses, {snippets} snippets")
+    for name, parse in (
+        ("legacy get_maybe", legacy_get_snippets),
+        ("parse_serp", lambda response: parse_serp(response).snippets),
+    ):
+        runs = 2000
+        seconds = min(
+            timeit.repeat(
+                lambda: [parse(response) for response in responses],
+                number=runs,
+                repeat=5,
+            )
+        )
+        print(f"{name:>20}: {seconds / runs * 1e6:8.1f} us per batch")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or DEFAULT_RESPONSES)
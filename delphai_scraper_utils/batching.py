@@ -0,0 +1,89 @@
+import asyncio
+import time
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from . import metrics
+from .embedding_store import EmbeddingStore
+from .relevancy import encode_unique
+
+
+class EmbeddingBatcher:
+    """
+    Encodes the texts of concurrently scored claims in shared model batches.
+    A batch goes out once `max_batch` texts are waiting or `max_delay` seconds
+    after the first of them, and is encoded in a worker thread so the event
+    loop keeps fetching. Requests arriving meanwhile make up the next batch
+    """
+
+    def __init__(
+        self,
+        model=None,
+        store: EmbeddingStore = None,
+        max_batch: int = 512,
+        max_delay: float = 0.01,
+        batch_size: int = 64,
+        scraper_id: str = None,
+    ):
+        self.model = model
+        self.store = store
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batch_size = batch_size
+        self.scraper_id = scraper_id
+        self._pending: List[Tuple[List[str], asyncio.Future]] = []
+        self._pending_texts = 0
+        self._full: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        encode_unique(texts), batched with other callers
+        """
+        if self._full is None:
+            self._full = asyncio.Event()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((list(texts), future))
+        self._pending_texts += len(texts)
+        if self._pending_texts >= self.max_batch:
+            self._full.set()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        return await future
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        started = time.perf_counter()
+        embeddings = encode_unique(texts, self.model, self.batch_size, self.store)
+        metrics.embedding_batch_encoded(
+            texts=len(texts),
+            duration=time.perf_counter() - started,
+            scraper_id=self.scraper_id,
+        )
+        return embeddings
+
+    async def _run(self):
+        while self._pending:
+            if self._pending_texts < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            self._full.clear()
+            batch, self._pending = self._pending, []
+            self._pending_texts = 0
+
+            texts = [text for request, _ in batch for text in request]
+            try:
+                embeddings = await asyncio.to_thread(self._encode, texts)
+            except Exception as ex:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(ex)
+                continue
+
+            offset = 0
+            for request, future in batch:
+                if not future.done():
+                    future.set_result(embeddings[offset : offset + len(request)])
+                offset += len(request)
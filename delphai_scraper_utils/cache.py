@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import unicodedata
+import zlib
+from time import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from .metrics import search_cache_lookup
+from .page import Page
+from .singleflight import SingleFlight
+
+DAY = 24 * 60 * 60
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class CacheStore:
+    """
+    zlib-compressed blobs in a SQLite file with an optional TTL and an
+    optional size bound, evicting least recently read entries first. WAL mode
+    lets several worker processes share one file
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        compress_level: int = 6,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.compress_level = compress_level
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                meta TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)"
+        )
+        self._db.commit()
+        (self._total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, Dict[str, Any], float]]:
+        now = time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, meta, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, meta, created = row
+            if self.ttl is not None and now - created > self.ttl:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute(
+                "UPDATE entries SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._db.commit()
+        try:
+            return zlib.decompress(value), json.loads(meta), created
+        except (zlib.error, ValueError) as ex:
+            logging.info(f"[cache] corrupt entry {key}: {repr(ex)}")
+            self.delete(key)
+            return None
+
+    def set(self, key: str, value: bytes, meta: Dict[str, Any] = None):
+        compressed = zlib.compress(value, self.compress_level)
+        now = time()
+        with self._lock:
+            previous = self._db.execute(
+                "SELECT size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, compressed, json.dumps(meta or {}), now, now, len(compressed)),
+            )
+            self._total += len(compressed) - (previous[0] if previous else 0)
+            if self.max_bytes is not None and self._total > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _evict(self):
+        # other processes may have written to the file, so start from the
+        # real total rather than this instance's running count
+        if self.ttl is not None:
+            self._db.execute(
+                "DELETE FROM entries WHERE created < ?", (time() - self.ttl,)
+            )
+        (self._total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if self._total <= self.max_bytes:
+            return
+        for key, size in self._db.execute(
+            "SELECT key, size FROM entries ORDER BY accessed"
+        ).fetchall():
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._total -= size
+            if self._total <= self.max_bytes:
+                break
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class HttpCache:
+    """
+    Raw response bodies and headers keyed by URL
+    """
+
+    CACHEABLE_STATUS_CODES = frozenset(range(200, 300)) | {404, 410}
+
+    def __init__(self, store: CacheStore):
+        self.store = store
+
+    @staticmethod
+    def key(url: str) -> str:
+        return content_hash(url.encode())
+
+    def get(self, url: str) -> Optional[Page]:
+        entry = self.store.get(self.key(url))
+        if entry is None:
+            return None
+        content, meta, _ = entry
+        return Page(
+            url=meta["url"],
+            status_code=meta["status_code"],
+            headers=meta["headers"],
+            content=content,
+            fetched_at=meta["fetched_at"],
+            from_cache=True,
+            encoding=meta.get("encoding"),
+            truncated=meta.get("truncated", False),
+        )
+
+    def set(self, page: Page):
+        if page.status_code not in self.CACHEABLE_STATUS_CODES:
+            return
+        self.store.set(
+            self.key(page.url),
+            page.content,
+            dict(
+                url=page.url,
+                status_code=page.status_code,
+                headers=page.headers,
+                fetched_at=page.fetched_at,
+                encoding=page.encoding,
+                truncated=page.truncated,
+            ),
+        )
+
+
+class TextCache:
+    """
+    Extraction output keyed by the hash of the HTML it came from, so the same
+    body is only deboilerplated once whatever URL served it
+    """
+
+    def __init__(self, store: CacheStore):
+        self.store = store
+
+    @staticmethod
+    def key(html: str, variant: str = "") -> str:
+        return content_hash(f"{variant}\0{html}".encode())
+
+    def get(self, html: str, variant: str = "") -> Optional[Any]:
+        entry = self.store.get(self.key(html, variant))
+        if entry is None:
+            return None
+        return json.loads(entry[0])
+
+    def set(self, html: str, value: Any, variant: str = ""):
+        self.store.set(
+            self.key(html, variant), json.dumps(value, ensure_ascii=False).encode()
+        )
+
+
+def normalize_query(query: str) -> str:
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return " ".join(query.split()).strip(" .!?\"'")
+
+
+def get_success(result: Dict[str, Any]) -> bool:
+    request_info = result.get("request_info") or {}
+    return request_info.get("success", True) is not False
+
+
+class SearchCache:
+    """
+    Search API responses keyed by normalised query plus request parameters.
+    Identical queries issued while one is in flight share its API call
+    """
+
+    def __init__(
+        self,
+        store: CacheStore,
+        ignored_params: Iterable[str] = ("api_key",),
+        scraper_id: Optional[str] = None,
+    ):
+        self.store = store
+        self.ignored_params = frozenset(ignored_params) | {"q"}
+        self.scraper_id = scraper_id
+        self._in_flight = SingleFlight()
+
+    def key(self, query: str, params: Dict[str, Any]) -> str:
+        params = {
+            name: str(value)
+            for name, value in params.items()
+            if name not in self.ignored_params
+        }
+        params["q"] = normalize_query(query)
+        return content_hash(json.dumps(params, sort_keys=True).encode())
+
+    async def get_or_fetch(
+        self,
+        query: str,
+        params: Dict[str, Any],
+        fetch: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+    ) -> Optional[Dict[str, Any]]:
+        key = self.key(query, params)
+        entry = await asyncio.to_thread(self.store.get, key)
+        if entry is not None:
+            search_cache_lookup(outcome="hit", scraper_id=self.scraper_id)
+            return json.loads(entry[0])
+
+        async def fetch_and_store():
+            result = await fetch()
+            if result and get_success(result):
+                await asyncio.to_thread(
+                    self.store.set, key, json.dumps(result).encode()
+                )
+            return result
+
+        result, shared = await self._in_flight.do(key, fetch_and_store)
+        search_cache_lookup(
+            outcome="coalesced" if shared else "miss", scraper_id=self.scraper_id
+        )
+        return result
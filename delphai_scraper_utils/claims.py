@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+Claim = Dict[str, Any]
+
+FORMAT_SUFFIXES = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".json": "jsonl",
+    ".parquet": "parquet",
+}
+
+
+def shard_of(claim_id: Any, num_shards: int) -> int:
+    # stable across processes and runs, unlike hash()
+    digest = hashlib.blake2b(str(claim_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % num_shards
+
+
+def detect_format(path: str) -> str:
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[: -len(".gz")]
+    for suffix, file_format in FORMAT_SUFFIXES.items():
+        if name.endswith(suffix):
+            return file_format
+    raise ValueError(f"unknown claim file format: {path}")
+
+
+class ClaimSource:
+    """
+    Streams claims from a CSV, JSONL or Parquet file in chunks of
+    `chunk_size` rows. `start`/`stop` select a row range of the file, then
+    rows are filtered by source and label and, for multi-worker runs, kept
+    only if their claim_id hashes to `shard`. Iterating asynchronously reads
+    each chunk in a thread and only when the consumer asks for more
+    """
+
+    def __init__(
+        self,
+        path: str,
+        file_format: Optional[str] = None,
+        chunk_size: int = 10_000,
+        start: int = 0,
+        stop: Optional[int] = None,
+        sources: Optional[Iterable[str]] = None,
+        labels: Optional[Iterable[Any]] = None,
+        shard: int = 0,
+        num_shards: int = 1,
+        id_field: str = "claim_id",
+    ):
+        if not 0 <= shard < num_shards:
+            raise ValueError(f"shard {shard} is not in [0, {num_shards})")
+        self.path = path
+        self.file_format = file_format or detect_format(path)
+        self.chunk_size = chunk_size
+        self.start = start
+        self.stop = stop
+        self.sources = set(sources) if sources is not None else None
+        # labels come back as bools from CSV and as strings from elsewhere
+        self.labels = (
+            {str(label).lower() for label in labels} if labels is not None else None
+        )
+        self.shard = shard
+        self.num_shards = num_shards
+        self.id_field = id_field
+
+    def _read_chunks(self) -> Iterator[pd.DataFrame]:
+        nrows = self.stop - self.start if self.stop is not None else None
+        if self.file_format == "csv":
+            # skipped rows are not parsed; keep the header (line 0)
+            yield from pd.read_csv(
+                self.path,
+                chunksize=self.chunk_size,
+                skiprows=range(1, self.start + 1),
+                nrows=nrows,
+                encoding="utf-8-sig",
+            )
+            return
+
+        if self.file_format == "jsonl":
+            chunks = pd.read_json(self.path, lines=True, chunksize=self.chunk_size)
+        elif self.file_format == "parquet":
+            chunks = self._read_parquet()
+        else:
+            raise ValueError(f"unknown claim file format: {self.file_format}")
+
+        row = 0
+        for chunk in chunks:
+            if self.stop is not None and row >= self.stop:
+                break
+            first = max(0, self.start - row)
+            last = len(chunk) if self.stop is None else self.stop - row
+            row += len(chunk)
+            if first < last:
+                yield chunk.iloc[first:last]
+
+    def _read_parquet(self) -> Iterator[pd.DataFrame]:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as ex:
+            raise ImportError("reading Parquet claim files needs pyarrow") from ex
+        for batch in pq.ParquetFile(self.path).iter_batches(
+            batch_size=self.chunk_size
+        ):
+            yield batch.to_pandas()
+
+    def _filter(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        if self.sources is not None:
+            chunk = chunk[chunk["source"].isin(self.sources)]
+        if self.labels is not None:
+            chunk = chunk[chunk["label"].astype(str).str.lower().isin(self.labels)]
+        if self.num_shards > 1:
+            chunk = chunk[
+                chunk[self.id_field].map(
+                    lambda claim_id: shard_of(claim_id, self.num_shards)
+                )
+                == self.shard
+            ]
+        return chunk
+
+    def chunks(self) -> Iterator[List[Claim]]:
+        for chunk in self._read_chunks():
+            chunk = self._filter(chunk)
+            if len(chunk):
+                yield chunk.to_dict(orient="records")
+
+    def __iter__(self) -> Iterator[Claim]:
+        for chunk in self.chunks():
+            yield from chunk
+
+    async def __aiter__(self) -> AsyncIterator[Claim]:
+        chunks = self.chunks()
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            for claim in chunk:
+                yield claim
@@ -1,3 +1,4 @@
+import asyncio
 import ssl
 import httpx
 
@@ -16,7 +17,7 @@ from httpx._config import (
     DEFAULT_TIMEOUT_CONFIG,
     Limits,
 )
-from httpx._models import Response, Cookies
+from httpx._models import Request, Response, Cookies
 from httpx._transports.base import AsyncBaseTransport
 from httpx._types import (
     AuthTypes,
@@ -39,12 +40,34 @@ from tenacity import (
     retry_if_exception_type,
     AsyncRetrying,
 )
-from typing import Callable, Any, List, Mapping, Union
-from .metrics import request_timer
-from aiocache import cached
-from urllib.robotparser import RobotFileParser
-from urllib.parse import urlparse, urljoin
+from time import perf_counter
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
+from .cache import HttpCache
+from .health import HostHealth, RetryBudget
+from .metrics import hedged_request_finished, request_timer, retry_budget_exhausted
+from .page import (
+    DEFAULT_MAX_PAGE_BYTES,
+    HTML_CONTENT_TYPES,
+    Page,
+    read_page,
+)
+from .robots import RobotsCache, RobotsEntry, default_robots_cache
+from .scheduler import HostScheduler, get_host, parse_retry_after
+from .transport import CrawlProfile, CrawlTransport, PoolStats, http2_available
+
 
+# failures that count against a host's circuit breaker
+HTTP_FAILURE_EXCEPTIONS = (httpx.TransportError, ssl.SSLError)
 
 HTTP_RETRY_EXCEPTION_TYPES = (
     retry_if_exception_type(TimeoutException)
@@ -87,7 +110,27 @@ class ScraperClient(AsyncClient):
         retry_wait_max: int = 1,
         ignore_robots_txt: bool = False,
         robot_txt_retries: int = 3,
+        cache: HttpCache = None,
+        robots_cache: RobotsCache = None,
+        scheduler: HostScheduler = None,
+        host_health: HostHealth = None,
+        retry_budget: RetryBudget = None,
+        hedge_requests: bool = True,
+        profile: CrawlProfile = None,
     ):
+        if profile is not None:
+            limits = profile.limits()
+            # httpx raises at construction for http2=True without h2; the
+            # CrawlTransport falls back to HTTP/1.1 on its own
+            http2 = profile.http2 and http2_available()
+            if transport is None and app is None:
+                transport = CrawlTransport(
+                    profile,
+                    verify=verify,
+                    cert=cert,
+                    trust_env=trust_env,
+                    scraper_id=scraper_id,
+                )
         super().__init__(
             auth=auth,
             params=params,
@@ -113,16 +156,31 @@ class ScraperClient(AsyncClient):
         self.persist_cookies = persist_cookies
         self.ignore_robots_txt = ignore_robots_txt
         self.robot_txt_retries = robot_txt_retries
+        self.cache = cache
+        self.robots_cache = robots_cache or default_robots_cache
+        self.scheduler = scheduler or HostScheduler(
+            max_in_flight=limits.max_connections or 100
+        )
+        self.host_health = host_health or HostHealth(scraper_id=scraper_id)
+        self.retry_budget = retry_budget or RetryBudget()
+        self.hedge_requests = hedge_requests
+        self.crawl_transport = (
+            transport if isinstance(transport, CrawlTransport) else None
+        )
 
         # Wrap request in retry decorator
-        self.request = retry(
-            stop=stop_after_attempt(max_retry_attempts),
+        retrying = retry(
+            # the budget is only consulted once a retry is actually due
+            stop=stop_after_attempt(max_retry_attempts)
+            | (lambda _: not self._spend_retry_budget()),
             wait=wait_random_exponential(
                 multiplier=retry_wait_multiplier, max=retry_wait_max
             ),
             retry=HTTP_RETRY_EXCEPTION_TYPES,
             reraise=True,
-        )(self.request)
+        )
+        self.request = retrying(self.request)
+        self.fetch_page = retrying(self.fetch_page)
 
     async def request(
         self,
@@ -155,49 +213,196 @@ class ScraperClient(AsyncClient):
             extensions=extensions,
         )
 
-        if not self.ignore_robots_txt:
-            user_agent = request.headers.get("user-agent", "*")
-            if not await self.is_allowed_by_robots_text(url, user_agent):
-                return Response(403, request=request)
+        if not await self.check_robots_txt(request):
+            return Response(403, request=request)
+
+        async with self.scheduler.slot(str(request.url)):
+            return await self._send(
+                request, auth=auth, follow_redirects=follow_redirects
+            )
+
+    async def check_robots_txt(self, request: Request) -> bool:
+        if self.ignore_robots_txt:
+            return True
+        user_agent = request.headers.get("user-agent", "*")
+        robots_entry = await self.get_robots_entry(str(request.url), user_agent)
+        if not robots_entry.can_fetch(str(request.url), user_agent):
+            return False
+        self.scheduler.set_crawl_delay(
+            get_host(str(request.url)), robots_entry.crawl_delay(user_agent)
+        )
+        return True
+
+    def _spend_retry_budget(self) -> bool:
+        if self.retry_budget.try_spend():
+            return True
+        retry_budget_exhausted(scraper_id=self.scraper_id)
+        return False
+
+    async def _send(self, request: Request, *, stream: bool = False, **kwargs):
+        host = get_host(str(request.url))
+        # raises CircuitOpenError for hosts that keep failing
+        probe = self.host_health.before_call(host)
+        self.retry_budget.record_request()
 
         if not self.persist_cookies:
             self._cookies = Cookies(None)
-        with request_timer(scraper_id=self.scraper_id):
-            return await self.send(
-                request, auth=auth, follow_redirects=follow_redirects
+        started = perf_counter()
+        try:
+            with request_timer(scraper_id=self.scraper_id):
+                response = await self.send(request, stream=stream, **kwargs)
+        except HTTP_FAILURE_EXCEPTIONS:
+            self.host_health.record_failure(host)
+            raise
+        except BaseException:
+            # cancelled, or failed without telling anything about the host: a
+            # half-open probe must not keep its slot, or the circuit never
+            # closes again
+            if probe:
+                self.host_health.release_probe(host)
+            raise
+        self.host_health.record_response(
+            host, response.status_code, perf_counter() - started
+        )
+
+        if response.status_code in (429, 503):
+            self.scheduler.back_off(
+                host, parse_retry_after(response.headers.get("retry-after"))
             )
+        return response
+
+    async def fetch_page(self, url: URLTypes, **kwargs) -> Page:
+        """
+        Streaming GET for documents. Non-HTML and oversized responses are
+        rejected from their headers (PageRejectedError) before the body is read,
+        at most `max_bytes` are read, and the body is decoded while it arrives.
+        Requests to a host slower than its usual tail latency are hedged
+        """
+        hedge_delay = None
+        if self.hedge_requests:
+            hedge_delay = self.host_health.hedge_delay(get_host(str(url)))
+        if hedge_delay is None:
+            return await self._fetch_page_once(url, **kwargs)
+        return await self._hedged(
+            hedge_delay, lambda: self._fetch_page_once(url, **kwargs)
+        )
 
-    @cached()
-    async def get_robots_text_parser(
-        self, base_url: str, user_agent: str
-    ) -> RobotFileParser:
-        robots_text_url = urljoin(base_url, "robots.txt")
-        robot_file_parser = RobotFileParser(robots_text_url)
+    async def _hedged(self, delay: float, attempt: Callable[[], Awaitable[Page]]):
+        primary = asyncio.ensure_future(attempt())
+        attempts = {primary: "primary"}
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._spend_retry_budget():
+                return await primary
+
+            attempts[asyncio.ensure_future(attempt())] = "hedge"
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        hedged_request_finished(
+                            scraper_id=self.scraper_id, winner=attempts[task]
+                        )
+                        return task.result()
+            # both attempts failed
+            return primary.result()
+        finally:
+            for task in attempts:
+                task.cancel()
 
+    async def _fetch_page_once(
+        self,
+        url: URLTypes,
+        *,
+        params: QueryParamTypes = None,
+        headers: HeaderTypes = None,
+        follow_redirects: Union[bool, UseClientDefault] = USE_CLIENT_DEFAULT,
+        timeout: Union[TimeoutTypes, UseClientDefault] = USE_CLIENT_DEFAULT,
+        max_bytes: int = DEFAULT_MAX_PAGE_BYTES,
+        content_types: Iterable[str] = HTML_CONTENT_TYPES,
+        on_sent: Callable[[], None] = None,
+        on_headers: Callable[[], None] = None,
+    ) -> Page:
+        request = self.build_request(
+            "GET", url, params=params, headers=headers, timeout=timeout
+        )
+        if not await self.check_robots_txt(request):
+            return Page(url=str(url), status_code=403, headers={}, content=b"")
+
+        async with self.scheduler.slot(str(request.url)):
+            if on_sent is not None:
+                on_sent()
+            response = await self._send(
+                request, stream=True, follow_redirects=follow_redirects
+            )
+            if on_headers is not None:
+                on_headers()
+            try:
+                return await read_page(
+                    str(url), response, max_bytes, frozenset(content_types)
+                )
+            except HTTP_FAILURE_EXCEPTIONS:
+                self.host_health.record_failure(get_host(str(request.url)))
+                raise
+            finally:
+                await response.aclose()
+
+    def pool_stats(self) -> Optional[PoolStats]:
+        """
+        Connection pool statistics, available when the client was built with a
+        CrawlProfile
+        """
+        if self.crawl_transport is None:
+            return None
+        return self.crawl_transport.stats()
+
+    async def get_page(self, url: str, **kwargs) -> Page:
+        """
+        GET through the HTTP cache: a fresh cached copy is returned without
+        touching the network, anything else is fetched and stored
+        """
+        if self.cache is not None:
+            page = await asyncio.to_thread(self.cache.get, url)
+            if page is not None:
+                return page
+
+        page = await self.fetch_page(url, **kwargs)
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.set, page)
+        return page
+
+    async def fetch_robots_text(
+        self, robots_text_url: str, user_agent: str
+    ) -> Tuple[int, str]:
+        """
+        GET a robots.txt under the host's circuit breaker and the shared retry
+        budget, like any other request. Raises CircuitOpenError without
+        touching the network while the host's circuit is open
+        """
         async for attempt in AsyncRetrying(
             stop=stop_after_attempt(self.robot_txt_retries)
+            | (lambda _: not self._spend_retry_budget()),
+            retry=retry_if_exception_type(HTTP_FAILURE_EXCEPTIONS),
+            reraise=True,
         ):
-            with request_timer(scraper_id=self.scraper_id), attempt:
-                response = await super().request(
-                    "GET",
-                    robots_text_url,
-                    headers={"user-agent": user_agent},
-                    follow_redirects=True,
+            with attempt:
+                request = self.build_request(
+                    "GET", robots_text_url, headers={"user-agent": user_agent}
                 )
+                response = await self._send(request, follow_redirects=True)
+        return response.status_code, response.text
 
-        # Logic taken from urllib.robotparser.RobotFileParser.read function
-        if response.status_code == 200:
-            robot_file_parser.parse(response.iter_lines())
-        elif response.status_code in (401, 403):
-            robot_file_parser.disallow_all = True
-        else:
-            # If no robots.txt is found, consider everything allowed
-            robot_file_parser.allow_all = True
-        return robot_file_parser
+    async def get_robots_entry(self, url: str, user_agent: str) -> RobotsEntry:
+        return await self.robots_cache.get(
+            url,
+            lambda robots_text_url: self.fetch_robots_text(
+                robots_text_url, user_agent
+            ),
+        )
 
     async def is_allowed_by_robots_text(self, url: str, user_agent: str) -> bool:
-        parsed_url = urlparse(url)
-        base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-        robots_text_parser = await self.get_robots_text_parser(base_url, user_agent)
-
-        return robots_text_parser.can_fetch(url=url, useragent=user_agent)
+        robots_entry = await self.get_robots_entry(url, user_agent)
+        return robots_entry.can_fetch(url, user_agent)
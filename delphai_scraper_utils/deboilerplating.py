@@ -1,26 +1,47 @@
 import trafilatura
 from goose3 import Goose
+import functools
 import re
 import justext
 import logging
 from cleantext import clean
+from typing import List
 
-goose = Goose()
+goose = None
+stoplist = None
 
+LINE_BREAKS = re.compile(r"\n+| \n")
 
+
+def init_extractors():
+    """
+    Build the Goose instance and the justext stoplist for this process. Called
+    once per extraction worker, and lazily on first use everywhere else
+    """
+    global goose, stoplist
+    goose = Goose()
+    stoplist = justext.get_stoplist("English")
+
+
+@functools.lru_cache(maxsize=2**15)
 def clean_text(text: str):
+    # the same line comes from trafilatura and goose, and navigation and
+    # footer lines repeat across pages of a site
     return clean(text, fix_unicode=True, to_ascii=False, lower=False, no_emoji=True)
 
+
 def formatting(text: str):
-    text = re.sub(r"\n+", "\n", text).strip()
-    list_sentences = text.split("\n")
-    list_sentences = [clean_text(sentence) for sentence in list_sentences]
-    if list_sentences == [""]:
-        list_sentences = []
-    return list_sentences
+    """
+    Cleaned non-empty lines of `text`. Same as collapsing runs of newlines,
+    stripping and splitting, without the intermediate copy
+    """
+    return [clean_text(line) for line in text.strip().split("\n") if line]
 
 
-def deboilerplating(html: str):
+def run_trafilatura(html) -> List[str]:
+    """
+    `html` may be a string or an already parsed lxml tree
+    """
     try:
         result_traf = trafilatura.extract(
             html,
@@ -36,6 +57,12 @@ def deboilerplating(html: str):
     except Exception as e:
         result_traf = []
         logging.info(f"error calling trafilatura: {e}")
+    return result_traf
+
+
+def run_goose(html: str) -> List[str]:
+    if goose is None:
+        init_extractors()
 
     try:
         result_goose = goose.extract(raw_html=html)
@@ -47,12 +74,19 @@ def deboilerplating(html: str):
     except Exception as e:
         result_goose = []
         logging.info(f"error calling goose3: {e}")
-    all_sentences = result_traf + result_goose
-    sentence_set = list(dict.fromkeys(all_sentences))
+    return result_goose
+
+
+def run_justext(html: str) -> List[str]:
+    """
+    Paragraphs justext classifies as boilerplate
+    """
+    if stoplist is None:
+        init_extractors()
 
     try:
         paragraphs = justext.justext(
-            html, justext.get_stoplist("English"), 50, 200, 0.1, 0.2, 0.2, 200, True
+            html, stoplist, 50, 200, 0.1, 0.2, 0.2, 200, True
         )
         invalid = [
             paragraph.text for paragraph in paragraphs if paragraph.is_boilerplate
@@ -60,6 +94,14 @@ def deboilerplating(html: str):
     except Exception as e:
         invalid = []
         logging.info(f"error calling justext: {e}")
+    return invalid
+
+
+def merge_sentences(
+    result_traf: List[str], result_goose: List[str], invalid: List[str]
+) -> List[str]:
+    all_sentences = result_traf + result_goose
+    sentence_set = list(dict.fromkeys(all_sentences))
 
     sentence_set = [
         sentence
@@ -77,6 +119,14 @@ def deboilerplating(html: str):
             else "\n" + sentence + "\n"
             for sentence in sentence_set
         ]
+    return sentence_set
+
+
+def deboilerplating(html: str):
+    result_traf = run_trafilatura(html)
+    result_goose = run_goose(html)
+    invalid = run_justext(html)
+    sentence_set = merge_sentences(result_traf, result_goose, invalid)
 
     return dict(
         {
@@ -91,11 +141,11 @@ def deboilerplating(html: str):
 def get_html(url: str) -> str:
     return trafilatura.fetch_url(url)
 
+def join_sentences(sentence_set: List[str]) -> str:
+    return LINE_BREAKS.sub("\n", "".join(sentence_set)).strip()
+
 def get_text_from_html(html: str) -> str:
     result = deboilerplating(html)
     #print('result:', result)
     #print('')
-    text = "".join(result["set"])
-    pattern = r"\n+| \n"
-    text = re.sub(pattern, "\n", text).strip()
-    return text
\ No newline at end of file
+    return join_sentences(result["set"])
\ No newline at end of file
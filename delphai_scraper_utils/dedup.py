@@ -0,0 +1,215 @@
+import re
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+
+from .utils import calculate_completeness, is_truncated
+
+TRACKING_PARAM_PREFIXES = ("utm_", "_hs", "mc_", "pk_", "vero_")
+IGNORED_PARAMS = frozenset(
+    (
+        "fbclid",
+        "gclid",
+        "dclid",
+        "msclkid",
+        "yclid",
+        "igshid",
+        "_ga",
+        "_gl",
+        "ocid",
+        "cmpid",
+        "smid",
+        "ref_src",
+        # AMP variants
+        "amp",
+        "outputtype",
+    )
+)
+# AMP caches that wrap the publisher url: /amp/s/<host>/<path>, /c/s/<host>/<path>
+AMP_CACHE_PATH = re.compile(r"^/(?:amp|c|v)/(s/)?(.+)$")
+AMP_PATH_SEGMENT = re.compile(r"/amp/?$", re.IGNORECASE)
+AMP_PATH_EXTENSION = re.compile(r"\.amp(\.html?)?$", re.IGNORECASE)
+WORD = re.compile(r"\w+")
+
+
+def _unwrap_amp_cache(host: str, path: str) -> Optional[str]:
+    if host.endswith(".cdn.ampproject.org") or (
+        host in ("google.com", "www.google.com") and path.startswith("/amp/")
+    ):
+        match = AMP_CACHE_PATH.match(path)
+        if match:
+            scheme = "https" if match.group(1) else "http"
+            return f"{scheme}://{match.group(2)}"
+    return None
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Lowercased scheme and host without www, default port, fragment, tracking
+    parameters and AMP variants; remaining query parameters sorted
+    """
+    if not url:
+        return url
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    unwrapped = _unwrap_amp_cache(host, parts.path)
+    if unwrapped:
+        return canonicalize_url(unwrapped)
+
+    for prefix in ("www.", "amp.", "m."):
+        if host.startswith(prefix):
+            host = host[len(prefix) :]
+    if parts.port and parts.port not in (80, 443):
+        host = f"{host}:{parts.port}"
+
+    path = AMP_PATH_EXTENSION.sub(r"\1", AMP_PATH_SEGMENT.sub("", parts.path)) or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = sorted(
+        (key, value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in IGNORED_PARAMS
+        and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    )
+    # http and https copies of a page are the same document
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+
+def shingle_hashes(text: str, size: int = 3) -> np.ndarray:
+    words = WORD.findall(text.casefold())
+    if len(words) >= size:
+        shingles = {
+            " ".join(words[index : index + size])
+            for index in range(len(words) - size + 1)
+        }
+    else:
+        shingles = set(words)
+    return np.fromiter(
+        (zlib.crc32(shingle.encode()) for shingle in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+
+
+class MinHasher:
+    """
+    MinHash signatures for many texts at once, using multiply-shift hashing
+    on 64-bit integers
+    """
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        generator = np.random.default_rng(seed)
+        # odd multipliers keep multiply-shift universal
+        multipliers = generator.integers(1, 2**63, size=num_perm, dtype=np.uint64)
+        self.a = multipliers | np.uint64(1)
+        self.b = generator.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """
+        (len(texts), num_perm) signatures; texts without words get all-max
+        rows, which match nothing
+        """
+        hashes = [shingle_hashes(text) for text in texts]
+        signatures = np.full(
+            (len(texts), self.num_perm), np.iinfo(np.uint64).max, dtype=np.uint64
+        )
+        nonempty = [index for index, value in enumerate(hashes) if len(value)]
+        if not nonempty:
+            return signatures
+        values = np.concatenate([hashes[index] for index in nonempty])
+        offsets = np.cumsum([0] + [len(hashes[index]) for index in nonempty[:-1]])
+        with np.errstate(over="ignore"):
+            permuted = self.a[:, None] * values[None, :] + self.b[:, None]
+        permuted >>= np.uint64(32)
+        signatures[nonempty] = np.minimum.reduceat(permuted, offsets, axis=1).T
+        return signatures
+
+
+def _find(parents: List[int], index: int) -> int:
+    while parents[index] != index:
+        parents[index] = parents[parents[index]]
+        index = parents[index]
+    return index
+
+
+def near_duplicate_groups(
+    signatures: np.ndarray, threshold: float = 0.7, bands: int = 16
+) -> List[int]:
+    """
+    Group id per row: rows sharing an LSH band are compared, and rows whose
+    estimated Jaccard similarity reaches `threshold` share a group
+    """
+    count, num_perm = signatures.shape
+    rows = num_perm // bands
+    empty = (signatures == np.iinfo(np.uint64).max).all(axis=1)
+    parents = list(range(count))
+
+    buckets: Dict[bytes, List[int]] = defaultdict(list)
+    for band in range(bands):
+        band_values = signatures[:, band * rows : (band + 1) * rows]
+        for index in range(count):
+            if not empty[index]:
+                key = band.to_bytes(2, "big") + band_values[index].tobytes()
+                buckets[key].append(index)
+
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        first = members[0]
+        similarity = (signatures[members[1:]] == signatures[first]).mean(axis=1)
+        for other, score in zip(members[1:], similarity):
+            if score >= threshold:
+                parents[_find(parents, other)] = _find(parents, first)
+    return [_find(parents, index) for index in range(count)]
+
+
+def _dedup_text(snippet: Dict[str, Any]) -> str:
+    title = snippet.get("title") or ""
+    if is_truncated(title):
+        title = title[: -len("...")]
+    return f"{title} {snippet.get('snippet') or ''}"
+
+
+def _preference(snippet: Dict[str, Any]):
+    return calculate_completeness(snippet), not is_truncated(snippet.get("title"))
+
+
+def dedupe_snippets(
+    snippets: List[Dict[str, Any]],
+    threshold: float = 0.7,
+    minhasher: MinHasher = None,
+    bands: int = 16,
+) -> List[Dict[str, Any]]:
+    """
+    Drop snippets whose link is the same page after canonicalize_url, then
+    collapse near-duplicate title + snippet text (syndicated copies of one
+    story). Of each group the most complete snippet is kept, in input order
+    """
+    if not snippets:
+        return []
+    minhasher = minhasher or MinHasher()
+    preferences = [_preference(snippet) for snippet in snippets]
+
+    by_url: Dict[str, int] = {}
+    for index, snippet in enumerate(snippets):
+        key = canonicalize_url(snippet.get("link") or "") or f"#{index}"
+        kept = by_url.get(key)
+        if kept is None or preferences[index] > preferences[kept]:
+            by_url[key] = index
+    candidates = sorted(by_url.values())
+
+    groups = near_duplicate_groups(
+        minhasher.signatures([_dedup_text(snippets[index]) for index in candidates]),
+        threshold,
+        bands,
+    )
+    best: Dict[int, int] = {}
+    for group, index in zip(groups, candidates):
+        kept = best.get(group)
+        if kept is None or preferences[index] > preferences[kept]:
+            best[group] = index
+    return [snippets[index] for index in sorted(best.values())]
@@ -0,0 +1,205 @@
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+DTYPES = ("float16", "int8")
+# index records: 16 byte text hash, row in the vector file. Void rather than
+# bytes keys: numpy strips trailing NULs from "S" fields
+INDEX_RECORD = np.dtype([("key", "V16"), ("row", "<i8")])
+INITIAL_CAPACITY = 1024
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _slug(model_name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", model_name)
+
+
+class EmbeddingStore:
+    """
+    Normalised embeddings of one model, keyed by text hash. Vectors live in a
+    memory-mapped float16 or int8 (with a float32 scale per row) array file,
+    so worker processes read the rows they need from the page cache instead
+    of each loading the store; the hash -> row index is an append-only file
+    replayed into a dict. Writers take an flock, so processes on one machine
+    can share a directory
+    """
+
+    def __init__(self, directory: str, model_name: str, dtype: str = "float16"):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, not {dtype}")
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{_slug(model_name)}.{dtype}")
+        self.model_name = model_name
+        self.dtype = dtype
+        self._meta_path = f"{base}.json"
+        self._vectors_path = f"{base}.vectors"
+        self._scales_path = f"{base}.scales"
+        self._index_path = f"{base}.index"
+        self._lock_path = f"{base}.lock"
+        self._thread_lock = threading.Lock()
+
+        self.dimension: Optional[int] = None
+        self._read_meta()
+        self._index: Dict[bytes, int] = {}
+        self._index_offset = 0
+        self._vectors: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None
+        self._refresh_index()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @contextmanager
+    def _file_lock(self):
+        with self._thread_lock, open(self._lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_meta(self):
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, encoding="utf-8") as f:
+                self.dimension = json.load(f)["dimension"]
+
+    def _refresh_index(self):
+        """
+        Replay index records appended since the last refresh, by this or any
+        other process
+        """
+        if not os.path.exists(self._index_path):
+            return
+        with open(self._index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # a crash can leave a partial record at the end
+        usable = len(data) - len(data) % INDEX_RECORD.itemsize
+        records = np.frombuffer(data[:usable], dtype=INDEX_RECORD)
+        self._index.update(zip(map(bytes, records["key"]), records["row"].tolist()))
+        self._index_offset += usable
+        if records.size:
+            self._vectors = None
+
+    def _map(self, rows_needed: int = 0):
+        """
+        Memory-map the vector (and scale) files, growing them to hold at least
+        rows_needed rows
+        """
+        row_bytes = self.dimension * np.dtype(self.dtype).itemsize
+        try:
+            capacity = os.path.getsize(self._vectors_path) // row_bytes
+        except FileNotFoundError:
+            capacity = 0
+        if rows_needed > capacity:
+            capacity = max(INITIAL_CAPACITY, capacity * 2, rows_needed)
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(capacity * row_bytes)
+            if self.dtype == "int8":
+                with open(self._scales_path, "ab") as f:
+                    f.truncate(capacity * 4)
+            self._vectors = None
+        if self._vectors is None or len(self._vectors) < capacity:
+            if capacity == 0:
+                return False
+            self._vectors = np.memmap(
+                self._vectors_path,
+                dtype=self.dtype,
+                mode="r+",
+                shape=(capacity, self.dimension),
+            )
+            if self.dtype == "int8":
+                self._scales = np.memmap(
+                    self._scales_path, dtype=np.float32, mode="r+", shape=(capacity,)
+                )
+        return True
+
+    def get_many(self, texts: Sequence[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        float32 embeddings for texts (zero rows where missing) and the
+        positions of the missing texts
+        """
+        keys = [text_key(text) for text in texts]
+        if any(key not in self._index for key in keys):
+            self._refresh_index()
+        if self.dimension is None:
+            # another process or instance may have written the first rows
+            self._read_meta()
+        rows = [self._index.get(key, -1) for key in keys]
+        missing = [position for position, row in enumerate(rows) if row < 0]
+        if self.dimension is None:
+            return np.zeros((len(texts), 0), dtype=np.float32), missing
+
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        found = np.array(
+            [position for position, row in enumerate(rows) if row >= 0], dtype=np.int64
+        )
+        if found.size and self._map():
+            found_rows = np.array([rows[position] for position in found])
+            vectors = self._vectors[found_rows].astype(np.float32)
+            if self.dtype == "int8":
+                vectors *= self._scales[found_rows][:, None]
+            # undo the rounding so cosine similarity stays a dot product
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            embeddings[found] = vectors
+        return embeddings, missing
+
+    def put_many(self, texts: Sequence[str], embeddings: np.ndarray):
+        if not len(texts):
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._file_lock():
+            if self.dimension is None:
+                self._read_meta()
+            if self.dimension is None:
+                self.dimension = embeddings.shape[1]
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump(
+                        dict(model_name=self.model_name, dimension=self.dimension), f
+                    )
+            elif embeddings.shape[1] != self.dimension:
+                raise ValueError(
+                    f"{self.model_name} store holds {self.dimension}-d vectors, "
+                    f"got {embeddings.shape[1]}-d"
+                )
+            self._refresh_index()
+            new = {}
+            for text, vector in zip(texts, embeddings):
+                key = text_key(text)
+                if key not in self._index and key not in new:
+                    new[key] = vector
+            if not new:
+                return
+
+            first_row = len(self._index)
+            rows = np.arange(first_row, first_row + len(new))
+            self._map(first_row + len(new))
+            vectors = np.stack(list(new.values()))
+            if self.dtype == "int8":
+                scales = np.abs(vectors).max(axis=1) / 127.0 + 1e-12
+                self._vectors[rows] = np.round(vectors / scales[:, None]).astype(
+                    np.int8
+                )
+                self._scales[rows] = scales
+                self._scales.flush()
+            else:
+                self._vectors[rows] = vectors.astype(np.float16)
+            self._vectors.flush()
+
+            # vectors first: an index record never points at an unwritten row
+            records = np.empty(len(new), dtype=INDEX_RECORD)
+            records["key"] = list(new)
+            records["row"] = rows
+            with open(self._index_path, "ab") as f:
+                f.write(records.tobytes())
+            self._refresh_index()
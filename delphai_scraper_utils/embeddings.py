@@ -0,0 +1,117 @@
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_DEVICE_ENV = "EMBEDDING_DEVICE"
+EMBEDDING_BACKEND_ENV = "EMBEDDING_BACKEND"
+EMBEDDING_THREADS_ENV = "EMBEDDING_THREADS"
+# torch-int8: Linear layers dynamically quantised to int8, CPU only
+BACKENDS = ("torch", "torch-int8")
+
+_models: Dict[Tuple[str, str, str], Any] = {}
+_models_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    """
+    Worker processes get a fresh lock; CPU models are copy-on-write and can be
+    kept, accelerator models hold a device context that does not survive fork
+    """
+    global _models_lock
+    _models_lock = threading.Lock()
+    for key in [key for key in _models if key[1] != "cpu"]:
+        del _models[key]
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def select_device(device: Optional[str] = None) -> str:
+    """
+    Explicit argument wins, then $EMBEDDING_DEVICE, then cuda > mps > cpu
+    """
+    device = device or os.getenv(EMBEDDING_DEVICE_ENV)
+    if device:
+        return device
+
+    import torch
+
+    if torch.cuda.is_available():
+        return "cuda"
+    mps = getattr(torch.backends, "mps", None)
+    if mps is not None and mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def select_backend(backend: Optional[str] = None) -> str:
+    """
+    Explicit argument wins, then $EMBEDDING_BACKEND, then torch
+    """
+    backend = backend or os.getenv(EMBEDDING_BACKEND_ENV) or "torch"
+    if backend not in BACKENDS:
+        raise ValueError(f"embedding backend must be one of {BACKENDS}, not {backend}")
+    return backend
+
+
+def _load(model_name: str, device: str, backend: str, threads: Optional[int]):
+    from sentence_transformers import SentenceTransformer
+
+    if threads:
+        import torch
+
+        torch.set_num_threads(threads)
+
+    model = SentenceTransformer(model_name, device=device)
+    if backend == "torch-int8":
+        if device != "cpu":
+            raise ValueError(f"the torch-int8 backend runs on cpu, not {device}")
+        import torch
+
+        model = torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return model
+
+
+def get_model(
+    model_name: str = DEFAULT_MODEL_NAME,
+    device: Optional[str] = None,
+    backend: Optional[str] = None,
+    threads: Optional[int] = None,
+):
+    """
+    Process-wide SentenceTransformer handle per backend, loaded on first use.
+    `threads` (default $EMBEDDING_THREADS) caps the CPU threads inference
+    uses; it is process-wide for torch and applies at load time
+    """
+    key = (model_name, select_device(device), select_backend(backend))
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            threads = threads or int(os.getenv(EMBEDDING_THREADS_ENV, 0))
+            logging.info(f"[embeddings] loading {model_name} on {key[1]} with {key[2]}")
+            model = _load(model_name, key[1], key[2], threads)
+            _models[key] = model
+    return model
+
+
+def warm_up(
+    model_name: str = DEFAULT_MODEL_NAME,
+    device: Optional[str] = None,
+    backend: Optional[str] = None,
+):
+    """
+    Load the model and run one forward pass so the first claim does not pay for
+    weight loading and kernel initialisation
+    """
+    model = get_model(model_name, device, backend)
+    model.encode(["warm up"], convert_to_tensor=True)
+    return model
@@ -0,0 +1,308 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from copy import deepcopy
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from newspaper import Article
+from trafilatura.utils import load_html
+
+from .cache import TextCache
+from .deboilerplating import (
+    init_extractors,
+    join_sentences,
+    merge_sentences,
+    run_goose,
+    run_justext,
+    run_trafilatura,
+)
+from .metrics import extractor_ran
+from .segmentation import SEGMENTER_ENV, get_splitter, segment
+
+SENTENCE_ENDINGS = (".", "!", "?", ".”", "”", '"')
+
+
+@dataclass
+class QualityBar:
+    min_chars: int = 500
+    # share of non-empty lines that end like a sentence
+    min_sentence_ratio: float = 0.5
+
+
+@dataclass
+class ExtractorAttempt:
+    extractor: str
+    duration: float
+    chars: int
+    score: float
+    accepted: bool
+
+
+@dataclass
+class ExtractionResult:
+    sentences: List[str] = field(default_factory=list)
+    extractor: Optional[str] = None
+    attempts: List[ExtractorAttempt] = field(default_factory=list)
+
+
+def score_text(text: str, quality: QualityBar) -> Tuple[float, bool]:
+    lines = [line for line in text.split("\n") if line.strip()]
+    if not lines:
+        return 0.0, False
+    sentence_ratio = sum(
+        line.rstrip().endswith(SENTENCE_ENDINGS) for line in lines
+    ) / len(lines)
+    score = min(1.0, len(text) / quality.min_chars) * (0.5 + 0.5 * sentence_ratio)
+    accepted = (
+        len(text) >= quality.min_chars
+        and sentence_ratio >= quality.min_sentence_ratio
+    )
+    return score, accepted
+
+
+class ParsedPage:
+    """
+    Per-page state shared by the extractors: the HTML is parsed into an lxml
+    tree once, and trafilatura/goose output is kept for the merged extractor
+    """
+
+    def __init__(self, html: str, url: str):
+        self.html = html
+        self.url = url
+        self._tree = None
+        self._trafilatura: Optional[List[str]] = None
+        self._goose: Optional[List[str]] = None
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = load_html(self.html)
+        return self._tree
+
+    def trafilatura_lines(self) -> List[str]:
+        if self._trafilatura is None:
+            tree = self.tree
+            # trafilatura prunes the tree it is given
+            self._trafilatura = run_trafilatura(
+                deepcopy(tree) if tree is not None else self.html
+            )
+        return self._trafilatura
+
+    def goose_lines(self) -> List[str]:
+        if self._goose is None:
+            self._goose = run_goose(self.html)
+        return self._goose
+
+
+def _trafilatura(page: ParsedPage) -> str:
+    return join_sentences(merge_sentences(page.trafilatura_lines(), [], []))
+
+
+def _goose(page: ParsedPage) -> str:
+    return join_sentences(merge_sentences([], page.goose_lines(), []))
+
+
+def _delphai(page: ParsedPage) -> str:
+    # trafilatura + goose, minus what justext flags as boilerplate
+    return join_sentences(
+        merge_sentences(
+            page.trafilatura_lines(), page.goose_lines(), run_justext(page.html)
+        )
+    )
+
+
+def _newspaper(page: ParsedPage) -> str:
+    article = Article(page.url)
+    article.set_html(page.html)
+    article.parse()
+    return article.text
+
+
+def _paragraphs(page: ParsedPage) -> str:
+    if page.tree is None:
+        return ""
+    return "\n".join(p.text_content() for p in page.tree.xpath("//body//p"))
+
+
+EXTRACTORS: Dict[str, Callable[[ParsedPage], str]] = {
+    "trafilatura": _trafilatura,
+    "goose": _goose,
+    "delphai": _delphai,
+    "newspaper": _newspaper,
+    "paragraphs": _paragraphs,
+}
+
+DEFAULT_EXTRACTOR_ORDER = ("trafilatura", "goose", "delphai", "newspaper", "paragraphs")
+
+
+def extract_article_result(
+    html: str,
+    url: str,
+    quality: QualityBar = None,
+    order: Sequence[str] = DEFAULT_EXTRACTOR_ORDER,
+) -> Tuple[Optional[str], Optional[str], List[ExtractorAttempt]]:
+    """
+    Run the extractors in `order` and stop at the first output that passes the
+    quality bar. Otherwise the best scoring non-empty output is returned
+    """
+    quality = quality or QualityBar()
+    page = ParsedPage(html, url)
+    attempts = []
+    best_text, best_extractor, best_score = None, None, 0.0
+
+    for extractor in order:
+        started = perf_counter()
+        try:
+            text = (EXTRACTORS[extractor](page) or "").strip()
+        except Exception as ex:
+            logging.info(f"error calling {extractor}: {repr(ex)}")
+            text = ""
+        duration = perf_counter() - started
+
+        score, accepted = score_text(text, quality)
+        attempts.append(
+            ExtractorAttempt(
+                extractor=extractor,
+                duration=duration,
+                chars=len(text),
+                score=score,
+                accepted=accepted,
+            )
+        )
+        if score > best_score:
+            best_text, best_extractor, best_score = text, extractor, score
+        if accepted:
+            break
+
+    return best_text, best_extractor, attempts
+
+
+def extract_article(html: str, url: str, **kwargs) -> Optional[str]:
+    return extract_article_result(html, url, **kwargs)[0]
+
+
+def extract_sentences(
+    html: str, url: str, segmenter: str = "punkt", **kwargs
+) -> ExtractionResult:
+    text, extractor, attempts = extract_article_result(html, url, **kwargs)
+    if not text:
+        return ExtractionResult(attempts=attempts)
+    return ExtractionResult(
+        sentences=segment(text, segmenter), extractor=extractor, attempts=attempts
+    )
+
+
+def init_worker(segmenter: str = "punkt"):
+    """
+    Extractors and sentence segmenter for an extraction worker, loaded once
+    instead of on its first page
+    """
+    init_extractors()
+    get_splitter(segmenter)
+
+
+def record_attempts(attempts: List[ExtractorAttempt]):
+    for attempt in attempts:
+        if attempt.accepted:
+            outcome = "accepted"
+        elif attempt.chars:
+            outcome = "rejected"
+        else:
+            outcome = "empty"
+        extractor_ran(
+            extractor=attempt.extractor, outcome=outcome, duration=attempt.duration
+        )
+
+
+class ExtractionExecutor:
+    """
+    Runs extract_sentences in a pool of worker processes so deboilerplating
+    does not block the event loop. The pool is started on first use
+    """
+
+    def __init__(
+        self,
+        max_workers: int = None,
+        start_method: str = "spawn",
+        quality: QualityBar = None,
+        order: Sequence[str] = DEFAULT_EXTRACTOR_ORDER,
+        cache: TextCache = None,
+        segmenter: str = None,
+    ):
+        self.max_workers = max_workers
+        self.start_method = start_method
+        self.cache = cache
+        self.segmenter = segmenter or os.getenv(SEGMENTER_ENV, "punkt")
+        quality = quality or QualityBar()
+        self._extract = functools.partial(
+            extract_sentences,
+            segmenter=self.segmenter,
+            quality=quality,
+            order=tuple(order),
+        )
+        # a different quality bar, order or segmenter must not reuse older
+        # results; Punkt output is cached under the key it always had
+        self._cache_variant = repr((quality, tuple(order)))
+        if self.segmenter != "punkt":
+            self._cache_variant += f" {self.segmenter}"
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=init_worker,
+                initargs=(self.segmenter,),
+            )
+        return self._pool
+
+    async def extract(self, html: str, url: str) -> ExtractionResult:
+        if self.cache is not None:
+            cached = await asyncio.to_thread(
+                self.cache.get, html, self._cache_variant
+            )
+            if cached is not None:
+                return ExtractionResult(**cached)
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(
+                self._get_pool(), self._extract, html, url
+            )
+        except BrokenProcessPool as ex:
+            # a worker died (e.g. a parser crashed on a hostile page); start
+            # a fresh pool for the following pages
+            logging.info(f"[extraction] worker pool broken on {url}: {repr(ex)}")
+            self.shutdown(wait=False)
+            return ExtractionResult()
+        except Exception as ex:
+            logging.info(f"[extraction] error for {url}: {repr(ex)}")
+            return ExtractionResult()
+        # prometheus metrics live in this process, not in the workers
+        record_attempts(result.attempts)
+        if self.cache is not None:
+            await asyncio.to_thread(
+                self.cache.set,
+                html,
+                dict(sentences=result.sentences, extractor=result.extractor),
+                self._cache_variant,
+            )
+        return result
+
+    def shutdown(self, wait: bool = True):
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
@@ -0,0 +1,181 @@
+from collections import deque
+from dataclasses import dataclass
+from time import monotonic
+from typing import Deque, Dict, Optional
+
+from .metrics import circuit_breaker_changed, circuit_breaker_rejected
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"circuit open for {host}, retry in {retry_in:.1f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+@dataclass
+class BreakerPolicy:
+    # consecutive failures that open the circuit
+    failure_threshold: int = 5
+    # seconds the circuit stays open before a probe is let through
+    reset_timeout: float = 60.0
+    half_open_max_calls: int = 1
+
+
+class CircuitBreaker:
+    def __init__(self, host: str, policy: BreakerPolicy, scraper_id: str = None):
+        self.host = host
+        self.policy = policy
+        self.scraper_id = scraper_id
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            circuit_breaker_changed(
+                scraper_id=self.scraper_id, previous=self.state, state=state
+            )
+            self.state = state
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpenError while the circuit is open; True when the call
+        is a half-open probe, whose slot release_probe() gives back if it
+        ends without an outcome
+        """
+        if self.state == OPEN:
+            retry_in = self.opened_at + self.policy.reset_timeout - monotonic()
+            if retry_in > 0:
+                circuit_breaker_rejected(scraper_id=self.scraper_id)
+                raise CircuitOpenError(self.host, retry_in)
+            self._set_state(HALF_OPEN)
+            self.probes = 0
+        if self.state == HALF_OPEN:
+            if self.probes >= self.policy.half_open_max_calls:
+                circuit_breaker_rejected(scraper_id=self.scraper_id)
+                raise CircuitOpenError(self.host, 0.0)
+            self.probes += 1
+            return True
+        return False
+
+    def release_probe(self):
+        if self.state == HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+
+    def record_success(self):
+        self.failures = 0
+        self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if (
+            self.state == HALF_OPEN
+            or self.failures >= self.policy.failure_threshold
+        ):
+            self.opened_at = monotonic()
+            self._set_state(OPEN)
+
+
+class RetryBudget:
+    """
+    Retries (and hedges) may add at most `ratio` on top of the requests sent
+    in the last `window` seconds, with a small floor so a quiet client can
+    still retry
+    """
+
+    def __init__(
+        self, ratio: float = 0.2, window: float = 10.0, min_retries: int = 10
+    ):
+        self.ratio = ratio
+        self.window = window
+        self.min_retries = min_retries
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+
+    def _prune(self, now: float):
+        for timestamps in (self._requests, self._retries):
+            while timestamps and now - timestamps[0] > self.window:
+                timestamps.popleft()
+
+    def record_request(self):
+        self._requests.append(monotonic())
+
+    def try_spend(self) -> bool:
+        now = monotonic()
+        self._prune(now)
+        allowed = max(self.min_retries, self.ratio * len(self._requests))
+        if len(self._retries) >= allowed:
+            return False
+        self._retries.append(now)
+        return True
+
+
+class HostHealth:
+    """
+    Per-host circuit breakers plus recent response latencies, from which the
+    delay before hedging a slow request is derived
+    """
+
+    def __init__(
+        self,
+        policy: BreakerPolicy = None,
+        scraper_id: str = None,
+        hedge_quantile: Optional[float] = 0.95,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 1.0,
+        latency_samples: int = 100,
+    ):
+        self.policy = policy or BreakerPolicy()
+        self.scraper_id = scraper_id
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.latency_samples = latency_samples
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(host, self.policy, self.scraper_id)
+            self._breakers[host] = breaker
+        return breaker
+
+    def before_call(self, host: str) -> bool:
+        return self.breaker(host).before_call()
+
+    def release_probe(self, host: str):
+        self.breaker(host).release_probe()
+
+    def record_response(self, host: str, status_code: int, latency: float):
+        if status_code >= 500:
+            self.breaker(host).record_failure()
+        else:
+            self.breaker(host).record_success()
+        latencies = self._latencies.get(host)
+        if latencies is None:
+            latencies = deque(maxlen=self.latency_samples)
+            self._latencies[host] = latencies
+        latencies.append(latency)
+
+    def record_failure(self, host: str):
+        self.breaker(host).record_failure()
+
+    def hedge_delay(self, host: str) -> Optional[float]:
+        if self.hedge_quantile is None:
+            return None
+        latencies = self._latencies.get(host)
+        if latencies is None or len(latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(latencies)
+        index = min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))
+        return max(self.hedge_min_delay, ordered[index])
+
+    def states(self) -> Dict[str, str]:
+        return {host: breaker.state for host, breaker in self._breakers.items()}
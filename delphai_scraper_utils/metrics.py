@@ -1,4 +1,4 @@
-from prometheus_client import Counter, Histogram
+from prometheus_client import Counter, Gauge, Histogram
 from contextlib import contextmanager
 from time import perf_counter
 from typing import Optional
@@ -53,3 +53,145 @@ scraper_datapoints = Histogram(
 def datapoints_found(*, data_type: str, amount: int, scraper_id: str = None):
     labels = dict(scraper_id=scraper_id, data_type=data_type)
     scraper_datapoints.labels(**labels).observe(amount)
+
+
+scraper_extractor_runs = Counter(
+    name="scraper_extractor_runs",
+    documentation="Extractor runs per outcome (accepted, rejected, empty)",
+    labelnames=["extractor", "outcome"],
+)
+
+scraper_extractor_duration = Histogram(
+    name="scraper_extractor_duration",
+    documentation="Time an extractor took on a single page",
+    labelnames=["extractor"],
+)
+
+
+def extractor_ran(*, extractor: str, outcome: str, duration: float):
+    scraper_extractor_runs.labels(extractor=extractor, outcome=outcome).inc()
+    scraper_extractor_duration.labels(extractor=extractor).observe(duration)
+
+
+scraper_search_cache_lookups = Counter(
+    name="scraper_search_cache_lookups",
+    documentation="Search API lookups per outcome (hit, miss, coalesced)",
+    labelnames=["scraper_id", "outcome"],
+)
+
+
+def search_cache_lookup(*, outcome: str, scraper_id: str = None):
+    scraper_search_cache_lookups.labels(scraper_id=scraper_id, outcome=outcome).inc()
+
+
+# no host label: a crawl touches an unbounded number of hosts. Per-host
+# states are available from HostHealth.states()
+scraper_circuit_breakers = Gauge(
+    name="scraper_circuit_breakers",
+    documentation="Hosts whose circuit breaker is open or half open",
+    labelnames=["scraper_id", "state"],
+)
+
+scraper_circuit_breaker_rejections = Counter(
+    name="scraper_circuit_breaker_rejections",
+    documentation="Requests failed fast because the host's circuit was open",
+    labelnames=["scraper_id"],
+)
+
+scraper_retry_budget_exhausted = Counter(
+    name="scraper_retry_budget_exhausted",
+    documentation="Retries or hedges skipped because the retry budget was spent",
+    labelnames=["scraper_id"],
+)
+
+scraper_hedged_requests = Counter(
+    name="scraper_hedged_requests",
+    documentation="Hedged requests by the attempt that answered first",
+    labelnames=["scraper_id", "winner"],
+)
+
+
+def circuit_breaker_changed(*, previous: str, state: str, scraper_id: str = None):
+    if previous != "closed":
+        scraper_circuit_breakers.labels(scraper_id=scraper_id, state=previous).dec()
+    if state != "closed":
+        scraper_circuit_breakers.labels(scraper_id=scraper_id, state=state).inc()
+
+
+def circuit_breaker_rejected(*, scraper_id: str = None):
+    scraper_circuit_breaker_rejections.labels(scraper_id=scraper_id).inc()
+
+
+def retry_budget_exhausted(*, scraper_id: str = None):
+    scraper_retry_budget_exhausted.labels(scraper_id=scraper_id).inc()
+
+
+def hedged_request_finished(*, winner: str, scraper_id: str = None):
+    scraper_hedged_requests.labels(scraper_id=scraper_id, winner=winner).inc()
+
+
+scraper_fetch_strategy_latency = Histogram(
+    name="scraper_fetch_strategy_latency",
+    documentation="Time until a fetch strategy returned a page",
+    labelnames=["scraper_id", "strategy"],
+)
+
+scraper_fetch_strategy_wins = Counter(
+    name="scraper_fetch_strategy_wins",
+    documentation="Fetches per strategy that delivered the page (none: all failed)",
+    labelnames=["scraper_id", "strategy"],
+)
+
+
+def fetch_strategy_finished(*, strategy: str, latency: float, scraper_id: str = None):
+    scraper_fetch_strategy_latency.labels(
+        scraper_id=scraper_id, strategy=strategy
+    ).observe(latency)
+
+
+def fetch_strategy_won(*, strategy: str, scraper_id: str = None):
+    scraper_fetch_strategy_wins.labels(scraper_id=scraper_id, strategy=strategy).inc()
+
+
+scraper_connection_handshake = Histogram(
+    name="scraper_connection_handshake",
+    documentation="Time spent opening new connections, by phase (dns, tcp, tls)",
+    labelnames=["scraper_id", "phase"],
+)
+
+
+def connection_handshake(*, phase: str, duration: float, scraper_id: str = None):
+    scraper_connection_handshake.labels(scraper_id=scraper_id, phase=phase).observe(
+        duration
+    )
+
+
+scraper_article_registry_lookups = Counter(
+    name="scraper_article_registry_lookups",
+    documentation="Article lookups per outcome (hit, miss, coalesced)",
+    labelnames=["scraper_id", "outcome"],
+)
+
+
+def article_registry_lookup(*, outcome: str, scraper_id: str = None):
+    scraper_article_registry_lookups.labels(
+        scraper_id=scraper_id, outcome=outcome
+    ).inc()
+
+
+scraper_embedding_batch_texts = Histogram(
+    name="scraper_embedding_batch_texts",
+    documentation="Texts per embedding batch, across concurrently scored claims",
+    labelnames=["scraper_id"],
+    buckets=(1, 8, 32, 64, 128, 256, 512, 1024, 2048),
+)
+scraper_embedding_batch_duration = Histogram(
+    name="scraper_embedding_batch_duration",
+    documentation="Time spent encoding an embedding batch",
+    labelnames=["scraper_id"],
+)
+
+
+def embedding_batch_encoded(*, texts: int, duration: float, scraper_id: str = None):
+    scraper_embedding_batch_texts.labels(scraper_id=scraper_id).observe(texts)
+    scraper_embedding_batch_duration.labels(scraper_id=scraper_id).observe(duration)
@@ -0,0 +1,148 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+from time import monotonic
+from typing import Any, Dict, Iterator, List, Optional, Set, TextIO
+
+Record = Dict[str, Any]
+
+
+def _open_text(path: str, mode: str) -> TextIO:
+    if path.endswith(".gz"):
+        # appending to a gzip file adds a member, readers see one stream
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def checkpoint_path(path: str) -> str:
+    return f"{path}.done"
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    checkpoint = checkpoint_path(path)
+    if not os.path.exists(checkpoint):
+        return set()
+    with open(checkpoint, encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+class JsonlWriter:
+    """
+    Appends one JSON record per line and keeps `<path>.done`, the ids of the
+    records already written. Ids are added to the checkpoint only after the
+    records are flushed, so a crash can at worst write a record twice, which
+    read_records drops. A `.gz` path is written gzip-compressed
+    """
+
+    def __init__(
+        self,
+        path: str,
+        id_field: str = "claim_id",
+        flush_every: int = 10,
+        flush_interval: float = 5.0,
+        fsync: bool = False,
+    ):
+        self.path = path
+        self.id_field = id_field
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.done = load_checkpoint(path)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = _open_text(path, "a")
+        self._checkpoint = open(checkpoint_path(path), "a", encoding="utf-8")
+        self._pending: List[str] = []
+        self._flushed_at = monotonic()
+
+    def is_done(self, record_id: Any) -> bool:
+        return str(record_id) in self.done
+
+    def write(self, record: Record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._pending.append(str(record[self.id_field]))
+        if (
+            len(self._pending) >= self.flush_every
+            or monotonic() - self._flushed_at >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        for record_id in self._pending:
+            self._checkpoint.write(record_id + "\n")
+            self.done.add(record_id)
+        self._checkpoint.flush()
+        self._pending = []
+        self._flushed_at = monotonic()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+        self._checkpoint.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_records(path: str, id_field: Optional[str] = "claim_id") -> Iterator[Record]:
+    """
+    Records of a JSONL file in order. A truncated last line (from a crash
+    mid-write) is skipped, and with `id_field` only the last copy of a
+    record written more than once is kept
+    """
+    last_line = {}
+    if id_field is not None:
+        for line_number, record in _parse_lines(path):
+            last_line[str(record[id_field])] = line_number
+    for line_number, record in _parse_lines(path):
+        if id_field is None or last_line[str(record[id_field])] == line_number:
+            yield record
+
+
+def _parse_lines(path: str):
+    with _open_text(path, "r") as f:
+        try:
+            for line_number, line in enumerate(f):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as ex:
+                    logging.info(f"[output] skipping line {line_number}: {repr(ex)}")
+        except EOFError as ex:
+            # gzip member cut short by a crash
+            logging.info(f"[output] {path} is truncated: {repr(ex)}")
+
+
+def convert_to_json(
+    jsonl_path: str, json_path: str, id_field: Optional[str] = "claim_id"
+):
+    """
+    Write the records as the pretty-printed JSON array the pipeline used to
+    produce with json.dump(..., indent=4), one record in memory at a time
+    """
+    with open(json_path, "w", encoding="utf-8") as f:
+        f.write("[")
+        first = True
+        for record in read_records(jsonl_path, id_field):
+            body = json.dumps(record, ensure_ascii=False, indent=4)
+            f.write("\n" if first else ",\n")
+            f.write("\n".join("    " + line for line in body.split("\n")))
+            first = False
+        f.write("]" if first else "\n]")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert JSONL output to JSON")
+    parser.add_argument("jsonl_path")
+    parser.add_argument("json_path")
+    args = parser.parse_args()
+    convert_to_json(args.jsonl_path, args.json_path)
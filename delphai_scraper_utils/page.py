@@ -0,0 +1,174 @@
+import codecs
+import re
+from dataclasses import dataclass, field
+from time import time
+from typing import Dict, FrozenSet, List, Optional
+
+from httpx import Response
+
+DEFAULT_MAX_PAGE_BYTES = 5 * 1024 * 1024
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+# how much of the body is looked at for <meta charset> and binary signatures
+SNIFF_BYTES = 4096
+
+BINARY_SIGNATURES = (b"%PDF", b"PK\x03\x04", b"\x89PNG", b"GIF8", b"\xff\xd8\xff")
+HEADER_CHARSET = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+META_CHARSET = re.compile(rb"<meta[^>]+charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+
+
+class PageRejectedError(Exception):
+    def __init__(self, url: str, reason: str):
+        super().__init__(f"{url}: {reason}")
+        self.url = url
+        self.reason = reason
+
+
+@dataclass
+class Page:
+    url: str
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+    fetched_at: float = field(default_factory=time)
+    from_cache: bool = False
+    encoding: Optional[str] = None
+    truncated: bool = False
+    decoded: Optional[str] = field(default=None, repr=False, compare=False)
+
+    @classmethod
+    def from_response(cls, url: str, response: Response) -> "Page":
+        return cls(
+            url=url,
+            status_code=response.status_code,
+            headers=dict(response.headers),
+            content=response.content,
+        )
+
+    @property
+    def text(self) -> str:
+        if self.decoded is not None:
+            return self.decoded
+        if self.encoding:
+            self.decoded = self.content.decode(self.encoding, errors="replace")
+        else:
+            # let httpx apply the same charset rules it uses for live responses
+            self.decoded = Response(
+                self.status_code, headers=self.headers, content=self.content
+            ).text
+        return self.decoded
+
+    @property
+    def content_type(self) -> Optional[str]:
+        return self.headers.get("content-type")
+
+
+def _valid_encoding(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    try:
+        return codecs.lookup(name.decode() if isinstance(name, bytes) else name).name
+    except (LookupError, UnicodeDecodeError):
+        return None
+
+
+def sniff_encoding(content_type: Optional[str], head: bytes) -> Optional[str]:
+    """
+    BOM, then the Content-Type charset, then <meta charset> in the first bytes
+    """
+    if head.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    match = HEADER_CHARSET.search(content_type or "")
+    encoding = _valid_encoding(match.group(1)) if match else None
+    if encoding:
+        return encoding
+    match = META_CHARSET.search(head[:SNIFF_BYTES])
+    return _valid_encoding(match.group(1)) if match else None
+
+
+def guess_encoding(head: bytes) -> str:
+    try:
+        from charset_normalizer import from_bytes
+    except ImportError:
+        return "utf-8"
+    best = from_bytes(head).best()
+    return best.encoding if best is not None else "utf-8"
+
+
+def looks_binary(head: bytes) -> bool:
+    return head.startswith(BINARY_SIGNATURES) or b"\x00" in head[:512]
+
+
+def check_headers(
+    url: str, response: Response, max_bytes: int, content_types: FrozenSet[str]
+):
+    content_type = response.headers.get("content-type")
+    if content_type:
+        mime_type = content_type.split(";", 1)[0].strip().lower()
+        if mime_type not in content_types:
+            raise PageRejectedError(url, f"content-type {mime_type}")
+    content_length = response.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        if int(content_length) > max_bytes:
+            raise PageRejectedError(url, f"content-length {content_length}")
+
+
+def _start_decoding(url: str, content_type: Optional[str], head: bytes):
+    if not content_type and looks_binary(head):
+        raise PageRejectedError(url, "binary body")
+    encoding = sniff_encoding(content_type, head) or guess_encoding(
+        head[:SNIFF_BYTES]
+    )
+    return encoding, codecs.getincrementaldecoder(encoding)(errors="replace")
+
+
+async def read_page(
+    url: str, response: Response, max_bytes: int, content_types: FrozenSet[str]
+) -> Page:
+    """
+    Read a streamed response into a Page, decoding chunks as they arrive and
+    stopping after max_bytes
+    """
+    check_headers(url, response, max_bytes, content_types)
+    content_type = response.headers.get("content-type")
+
+    chunks: List[bytes] = []
+    texts: List[str] = []
+    size = 0
+    truncated = False
+    encoding, decoder = None, None
+    head = b""
+
+    async for chunk in response.aiter_bytes():
+        if size + len(chunk) > max_bytes:
+            chunk = chunk[: max_bytes - size]
+            truncated = True
+        size += len(chunk)
+        chunks.append(chunk)
+
+        if decoder is None:
+            # hold back the first bytes until there is enough to sniff
+            head += chunk
+            if len(head) < SNIFF_BYTES and not truncated:
+                continue
+            encoding, decoder = _start_decoding(url, content_type, head)
+            chunk, head = head, b""
+        texts.append(decoder.decode(chunk))
+        if truncated:
+            break
+
+    if decoder is None:
+        encoding, decoder = _start_decoding(url, content_type, head)
+        texts.append(decoder.decode(head))
+    texts.append(decoder.decode(b"", final=True))
+
+    return Page(
+        url=url,
+        status_code=response.status_code,
+        headers=dict(response.headers),
+        content=b"".join(chunks),
+        encoding=encoding,
+        truncated=truncated,
+        decoded="".join(texts),
+    )
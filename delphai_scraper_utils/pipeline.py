@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    TypeVar,
+    Union,
+)
+from urllib.parse import urlparse
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# result of a claim whose processing raised
+_FAILED = object()
+
+
+@dataclass
+class ConcurrencyLimits:
+    claims: int = 8
+    requests: int = 32
+    requests_per_claim: int = 4
+    requests_per_domain: int = 2
+    # completed results held back while an earlier claim is still running
+    reorder_buffer: int = 64
+
+
+async def _iterate(items: Union[Iterable[T], AsyncIterable[T]]) -> AsyncIterator[T]:
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+class ClaimPipeline:
+    """
+    Fans out over claims and over the links of each claim while keeping the
+    number of in-flight claims, requests, requests per claim and requests per
+    domain bounded
+    """
+
+    def __init__(self, limits: ConcurrencyLimits = None):
+        self.limits = limits or ConcurrencyLimits()
+        self._requests = asyncio.Semaphore(self.limits.requests)
+        self._domains: Dict[str, asyncio.Semaphore] = {}
+
+    def _domain_semaphore(self, url: str) -> asyncio.Semaphore:
+        domain = urlparse(url).netloc.lower()
+        semaphore = self._domains.get(domain)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.limits.requests_per_domain)
+            self._domains[domain] = semaphore
+        return semaphore
+
+    @asynccontextmanager
+    async def request_slot(self, url: str):
+        # domain first, so a request queued behind a busy host does not hold
+        # one of the global slots while it waits
+        async with self._domain_semaphore(url):
+            async with self._requests:
+                yield
+
+    async def map_links(
+        self, items: Iterable[T], fn: Callable[[T], Awaitable[R]]
+    ) -> List[R]:
+        claim_limit = asyncio.Semaphore(self.limits.requests_per_claim)
+
+        async def run_one(item: T) -> R:
+            async with claim_limit:
+                return await fn(item)
+
+        return await asyncio.gather(*(run_one(item) for item in items))
+
+    async def run(
+        self,
+        claims: Union[Iterable[T], AsyncIterable[T]],
+        process: Callable[[T], Awaitable[R]],
+    ) -> AsyncIterator[R]:
+        """
+        Yield process(claim) for every claim in input order. The next claim is
+        only pulled from `claims` once a slot is free. A claim whose processing
+        raises is logged and left out, the others carry on
+        """
+        active = asyncio.Semaphore(self.limits.claims)
+        pending: Deque[asyncio.Future] = deque()
+
+        async def run_one(claim: T) -> R:
+            try:
+                return await process(claim)
+            except Exception as ex:
+                logging.info(f"[pipeline] claim failed: {repr(ex)}")
+                return _FAILED
+            finally:
+                active.release()
+
+        try:
+            async for claim in _iterate(claims):
+                await active.acquire()
+                pending.append(asyncio.ensure_future(run_one(claim)))
+                while pending and pending[0].done():
+                    result = pending.popleft().result()
+                    if result is not _FAILED:
+                        yield result
+                if len(pending) > self.limits.reorder_buffer:
+                    result = await pending.popleft()
+                    if result is not _FAILED:
+                        yield result
+            while pending:
+                result = await pending.popleft()
+                if result is not _FAILED:
+                    yield result
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,49 @@
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+from .dedup import canonicalize_url
+from .metrics import article_registry_lookup
+from .singleflight import SingleFlight
+
+T = TypeVar("T")
+
+
+class ArticleRegistry(Generic[T]):
+    """
+    Run-scoped results per canonical URL, so an article that comes up for
+    many claims is fetched and extracted once. Requests for a URL whose load
+    is in flight wait for it; completed results (including empty ones) are
+    kept in a bounded LRU. A load that raises is not kept
+    """
+
+    def __init__(self, max_entries: int = 100_000, scraper_id: Optional[str] = None):
+        self.max_entries = max_entries
+        self.scraper_id = scraper_id
+        self._results: "OrderedDict[str, T]" = OrderedDict()
+        self._in_flight = SingleFlight()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def __contains__(self, url: str) -> bool:
+        return canonicalize_url(url) in self._results
+
+    async def get(self, url: str, load: Callable[[], Awaitable[T]]) -> T:
+        key = canonicalize_url(url)
+        if key in self._results:
+            self._results.move_to_end(key)
+            article_registry_lookup(outcome="hit", scraper_id=self.scraper_id)
+            return self._results[key]
+
+        async def load_and_keep():
+            result = await load()
+            self._results[key] = result
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+            return result
+
+        result, shared = await self._in_flight.do(key, load_and_keep)
+        article_registry_lookup(
+            outcome="coalesced" if shared else "miss", scraper_id=self.scraper_id
+        )
+        return result
@@ -0,0 +1,303 @@
+import re
+import numpy as np
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+from .embeddings import get_model
+from .embedding_store import EmbeddingStore
+from .utils import is_truncated
+
+TOKEN = re.compile(r"\w+")
+# only the words that make almost any two English texts overlap
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "their this to was were will with".split()
+)
+
+
+def encode_unique(
+    texts: Sequence[str],
+    model=None,
+    batch_size: int = 64,
+    store: EmbeddingStore = None,
+):
+    """
+    Encode texts in one batch, running the model once per distinct string.
+    With a `store`, stored embeddings are reused and the model is only loaded
+    for texts it has not seen. Returns L2-normalised float32 embeddings
+    aligned with `texts`
+    """
+    index: Dict[str, int] = {}
+    inverse = np.fromiter(
+        (index.setdefault(text, len(index)) for text in texts),
+        dtype=np.int64,
+        count=len(texts),
+    )
+    unique = list(index)
+    missing = range(len(unique))
+    if store is not None:
+        embeddings, missing = store.get_many(unique)
+        if not missing and embeddings.shape[1]:
+            return embeddings[inverse]
+
+    model = model or get_model()
+    if not unique:
+        dimension = model.get_sentence_embedding_dimension()
+        return np.zeros((0, dimension), dtype=np.float32)
+    encoded = model.encode(
+        [unique[i] for i in missing],
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    )
+    if store is None:
+        return encoded[inverse]
+    store.put_many([unique[i] for i in missing], encoded)
+    # the store may have had no dimension yet (nothing stored), so build the
+    # result from scratch and place stored and new vectors by position
+    combined = np.zeros((len(unique), encoded.shape[1]), dtype=np.float32)
+    found = np.setdiff1d(np.arange(len(unique)), missing)
+    if found.size:
+        combined[found] = embeddings[found]
+    combined[missing] = encoded
+    return combined[inverse]
+
+
+def _flatten(
+    queries: Sequence[str], titles_per_query: Sequence[Sequence[str]]
+) -> Tuple[List[str], np.ndarray]:
+    counts = np.fromiter(
+        (len(titles) for titles in titles_per_query),
+        dtype=np.int64,
+        count=len(titles_per_query),
+    )
+    texts = list(queries)
+    for titles in titles_per_query:
+        texts.extend(titles)
+    return texts, counts
+
+
+def _cosine_scores(
+    embeddings: np.ndarray, query_count: int, counts: np.ndarray
+) -> List[np.ndarray]:
+    query_embeddings = embeddings[:query_count]
+    title_embeddings = embeddings[query_count:]
+
+    owners = np.repeat(np.arange(query_count), counts)
+    # normalised vectors: row-wise dot product == cosine similarity
+    scores = np.einsum("ij,ij->i", title_embeddings, query_embeddings[owners])
+    return np.split(scores, np.cumsum(counts)[:-1])
+
+
+def score_batch(
+    queries: Sequence[str],
+    titles_per_query: Sequence[Sequence[str]],
+    model=None,
+    batch_size: int = 64,
+    store: EmbeddingStore = None,
+) -> List[np.ndarray]:
+    """
+    Cosine similarity of every title with the query it belongs to. Queries and
+    titles of all claims are encoded in a single batch
+    """
+    texts, counts = _flatten(queries, titles_per_query)
+    embeddings = encode_unique(texts, model=model, batch_size=batch_size, store=store)
+    return _cosine_scores(embeddings, len(queries), counts)
+
+
+def select_top(scores: np.ndarray, threshold: float, top_n: int) -> np.ndarray:
+    """
+    Indices of scores >= threshold, highest first, at most top_n of them
+    """
+    candidates = np.flatnonzero(scores >= threshold)
+    candidate_scores = scores[candidates]
+    if top_n < len(candidates):
+        keep = np.argpartition(-candidate_scores, top_n - 1)[:top_n]
+        candidates = candidates[keep]
+        candidate_scores = candidate_scores[keep]
+    order = np.argsort(-candidate_scores, kind="stable")
+    return candidates[order]
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN.findall(text.casefold()) if token not in STOPWORDS]
+
+
+def bm25_scores(
+    query: str, documents: Sequence[str], k1: float = 1.5, b: float = 0.75
+) -> np.ndarray:
+    """
+    BM25 of every document for the query, with IDF taken over `documents`
+    """
+    tokenized = [tokenize(document) for document in documents]
+    if not tokenized:
+        return np.zeros(0)
+    lengths = np.fromiter(map(len, tokenized), dtype=np.float64, count=len(tokenized))
+    average_length = lengths.mean() or 1.0
+    counts = [Counter(tokens) for tokens in tokenized]
+
+    scores = np.zeros(len(tokenized))
+    for term in set(tokenize(query)):
+        frequencies = np.fromiter(
+            (count[term] for count in counts), dtype=np.float64, count=len(counts)
+        )
+        matches = np.count_nonzero(frequencies)
+        if not matches:
+            continue
+        idf = np.log1p((len(counts) - matches + 0.5) / (matches + 0.5))
+        scores += idf * (
+            frequencies
+            * (k1 + 1)
+            / (frequencies + k1 * (1 - b + b * lengths / average_length))
+        )
+    return scores
+
+
+def snippet_text(snippet: dict, fields: str = "title+snippet") -> str:
+    title = snippet["title"] or ""
+    if fields == "title":
+        return title
+    if is_truncated(title):
+        title = title[: -len("...")].rstrip()
+    text = snippet.get("snippet") or ""
+    return f"{title}. {text}" if title else str(text)
+
+
+def _texts_to_score(
+    queries: Sequence[str],
+    snippets_per_query: Sequence[List[dict]],
+    fields: str,
+    prefilter: bool,
+) -> Tuple[List[List[int]], List[List[str]]]:
+    kept_per_query = []
+    texts_per_query = []
+    for query, snippets in zip(queries, snippets_per_query):
+        texts = [snippet_text(snippet, fields) for snippet in snippets]
+        kept = range(len(snippets))
+        if prefilter:
+            kept = np.flatnonzero(bm25_scores(query, texts) > 0).tolist()
+        kept_per_query.append(kept)
+        texts_per_query.append([texts[i] for i in kept])
+    return kept_per_query, texts_per_query
+
+
+def _set_relevancy(snippets_per_query, kept_per_query, all_scores):
+    for snippets, kept, scores in zip(snippets_per_query, kept_per_query, all_scores):
+        for snippet in snippets:
+            snippet["relevancy"] = None
+        for i, score in zip(kept, scores.tolist()):
+            snippets[i]["relevancy"] = score
+
+
+def score_snippets(
+    queries: Sequence[str],
+    snippets_per_query: Sequence[List[dict]],
+    model=None,
+    fields: str = "title+snippet",
+    prefilter: bool = True,
+    store: EmbeddingStore = None,
+):
+    """
+    Set `relevancy` on the snippets. With `prefilter`, snippets that share no
+    term with their query (BM25 of 0) are not sent through the model and keep
+    relevancy None
+    """
+    kept_per_query, texts_per_query = _texts_to_score(
+        queries, snippets_per_query, fields, prefilter
+    )
+    all_scores = score_batch(queries, texts_per_query, model=model, store=store)
+    _set_relevancy(snippets_per_query, kept_per_query, all_scores)
+
+
+async def score_snippets_async(
+    queries: Sequence[str],
+    snippets_per_query: Sequence[List[dict]],
+    batcher,
+    fields: str = "title+snippet",
+    prefilter: bool = True,
+):
+    """
+    score_snippets through an EmbeddingBatcher, so the texts are encoded
+    together with those of other claims scored at the same time
+    """
+    kept_per_query, texts_per_query = _texts_to_score(
+        queries, snippets_per_query, fields, prefilter
+    )
+    texts, counts = _flatten(queries, texts_per_query)
+    embeddings = await batcher.encode(texts)
+    all_scores = _cosine_scores(embeddings, len(queries), counts)
+    _set_relevancy(snippets_per_query, kept_per_query, all_scores)
+
+
+def select_relevant(snippets: List[dict], threshold: float, top_n: int) -> List[dict]:
+    scores = np.fromiter(
+        (
+            -1.0 if snippet.get("relevancy") is None else snippet["relevancy"]
+            for snippet in snippets
+        ),
+        dtype=np.float64,
+        count=len(snippets),
+    )
+    return [snippets[i] for i in select_top(scores, threshold, top_n)]
+
+
+def near_threshold(
+    snippets: List[dict], threshold: float, margin: float = 0.05
+) -> List[dict]:
+    """
+    Snippets with a truncated title scored within `margin` of the threshold:
+    the only ones worth fetching the full title for
+    """
+    return [
+        snippet
+        for snippet in snippets
+        if is_truncated(snippet["title"])
+        and snippet.get("relevancy") is not None
+        and abs(snippet["relevancy"] - threshold) <= margin
+    ]
+
+
+def rank_snippets_batch(
+    queries: Sequence[str],
+    snippets_per_query: Sequence[List[dict]],
+    threshold: float,
+    top_n: int,
+    model=None,
+    fields: str = "title+snippet",
+    prefilter: bool = True,
+    store: EmbeddingStore = None,
+) -> List[List[dict]]:
+    """
+    Set `relevancy` on the snippets and return the relevant ones per query
+    """
+    score_snippets(queries, snippets_per_query, model, fields, prefilter, store)
+    return [
+        select_relevant(snippets, threshold, top_n) for snippets in snippets_per_query
+    ]
+
+
+def rank_snippets(
+    query: str,
+    snippets: List[dict],
+    threshold: float,
+    top_n: int,
+    model=None,
+    fields: str = "title+snippet",
+    prefilter: bool = True,
+    store: EmbeddingStore = None,
+) -> List[dict]:
+    return rank_snippets_batch(
+        [query], [snippets], threshold, top_n, model, fields, prefilter, store
+    )[0]
+
+
+async def rank_snippets_async(
+    query: str,
+    snippets: List[dict],
+    threshold: float,
+    top_n: int,
+    batcher,
+    fields: str = "title+snippet",
+    prefilter: bool = True,
+) -> List[dict]:
+    await score_snippets_async([query], [snippets], batcher, fields, prefilter)
+    return select_relevant(snippets, threshold, top_n)
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+from .cache import DAY, CacheStore
+from .health import CircuitOpenError
+from .singleflight import SingleFlight
+
+# (status_code, body) of a robots.txt request
+RobotsFetcher = Callable[[str], Awaitable[Tuple[int, str]]]
+
+# how long a robots.txt answered with a 5xx keeps its origin disallowed
+# before it is fetched again
+FAILURE_TTL = 10 * 60
+# the same for a fetch that raised (timeout, reset connection) after the
+# client's own retries: likely a hiccup, so it is only kept long enough to
+# spare the host a download per link
+ERROR_TTL = 30
+
+
+def get_origin(url: str) -> str:
+    parsed_url = urlparse(url)
+    return f"{parsed_url.scheme}://{parsed_url.netloc}".lower()
+
+
+def is_unreachable(status_code: Optional[int]) -> bool:
+    return status_code is None or status_code >= 500
+
+
+def parse_robots_text(robots_text_url: str, status_code: Optional[int], text: str):
+    """
+    Status handling follows RFC 9309: any 4xx means there are no rules, an
+    unreachable file (no response or 5xx) means nothing may be crawled
+    """
+    robot_file_parser = RobotFileParser(robots_text_url)
+    if status_code == 200:
+        robot_file_parser.parse(text.splitlines())
+    elif is_unreachable(status_code):
+        robot_file_parser.disallow_all = True
+    else:
+        # If no robots.txt is found, consider everything allowed
+        robot_file_parser.allow_all = True
+    return robot_file_parser
+
+
+@dataclass
+class RobotsEntry:
+    parser: RobotFileParser
+    fetched_at: float
+    # overrides the cache's TTL, for failures
+    ttl: Optional[float] = None
+
+    def can_fetch(self, url: str, user_agent: str) -> bool:
+        return self.parser.can_fetch(url=url, useragent=user_agent)
+
+    def can_fetch_many(
+        self, url: str, user_agents: Iterable[str]
+    ) -> Dict[str, bool]:
+        return {
+            user_agent: self.can_fetch(url, user_agent) for user_agent in user_agents
+        }
+
+    def crawl_delay(self, user_agent: str) -> Optional[float]:
+        delay = self.parser.crawl_delay(user_agent)
+        return float(delay) if delay is not None else None
+
+
+class RobotsCache:
+    """
+    Parsed robots.txt files per origin, shared by every client in the process.
+    Bounded LRU with a TTL; concurrent lookups of an uncached origin share one
+    download, and a CacheStore can persist the raw files across processes.
+    A 5xx is cached as disallow-all for `failure_ttl`, a fetch that raised
+    for the much shorter `error_ttl`; while the host's circuit is open
+    nothing is cached
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl: float = DAY,
+        store: Optional[CacheStore] = None,
+        failure_ttl: float = FAILURE_TTL,
+        error_ttl: float = ERROR_TTL,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.error_ttl = error_ttl
+        self.store = store
+        self._entries: "OrderedDict[str, RobotsEntry]" = OrderedDict()
+        self._in_flight = SingleFlight()
+
+    def _get_fresh(self, origin: str) -> Optional[RobotsEntry]:
+        entry = self._entries.get(origin)
+        if entry is None:
+            return None
+        ttl = self.ttl if entry.ttl is None else entry.ttl
+        if time() - entry.fetched_at > ttl:
+            del self._entries[origin]
+            return None
+        self._entries.move_to_end(origin)
+        return entry
+
+    def _put(self, origin: str, entry: RobotsEntry):
+        self._entries[origin] = entry
+        self._entries.move_to_end(origin)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def peek(self, url: str) -> Optional[RobotsEntry]:
+        return self._get_fresh(get_origin(url))
+
+    async def get(self, url: str, fetch: RobotsFetcher) -> RobotsEntry:
+        origin = get_origin(url)
+        entry = self._get_fresh(origin)
+        if entry is None:
+            entry, _ = await self._in_flight.do(
+                origin, lambda: self._load(origin, fetch)
+            )
+        return entry
+
+    def _entry(
+        self,
+        robots_text_url: str,
+        status_code: Optional[int],
+        text: str,
+        fetched_at: float,
+    ) -> RobotsEntry:
+        return RobotsEntry(
+            parser=parse_robots_text(robots_text_url, status_code, text),
+            fetched_at=fetched_at,
+            ttl=self.failure_ttl if is_unreachable(status_code) else None,
+        )
+
+    async def _load(self, origin: str, fetch: RobotsFetcher) -> RobotsEntry:
+        robots_text_url = f"{origin}/robots.txt"
+
+        if self.store is not None:
+            stored = await asyncio.to_thread(self.store.get, robots_text_url)
+            if stored is not None:
+                body, meta, fetched_at = stored
+                entry = self._entry(
+                    robots_text_url, meta["status_code"], body.decode(), fetched_at
+                )
+                ttl = self.ttl if entry.ttl is None else entry.ttl
+                if time() - fetched_at <= ttl:
+                    self._put(origin, entry)
+                    return entry
+
+        try:
+            status_code, text = await fetch(robots_text_url)
+        except CircuitOpenError:
+            # the breaker already fails these fast and knows when to probe
+            raise
+        except Exception as ex:
+            logging.info(f"[robots] {robots_text_url} unreachable: {repr(ex)}")
+            entry = RobotsEntry(
+                parser=parse_robots_text(robots_text_url, None, ""),
+                fetched_at=time(),
+                ttl=self.error_ttl,
+            )
+            self._put(origin, entry)
+            return entry
+
+        entry = self._entry(robots_text_url, status_code, text, time())
+        self._put(origin, entry)
+        if self.store is not None and not is_unreachable(status_code):
+            await asyncio.to_thread(
+                self.store.set,
+                robots_text_url,
+                text.encode(),
+                dict(status_code=status_code),
+            )
+        return entry
+
+
+default_robots_cache = RobotsCache()
@@ -0,0 +1,188 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from time import monotonic
+from typing import Deque, Dict, Optional
+from urllib.parse import urlparse
+
+
+@dataclass
+class HostPolicy:
+    # token bucket: sustained requests per second and burst size
+    rate: float = 4.0
+    burst: int = 4
+    max_in_flight: int = 4
+    # used for 429/503 responses without a usable Retry-After header
+    default_backoff: float = 5.0
+
+
+def get_host(url: str) -> str:
+    return urlparse(url).netloc.lower()
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class _HostState:
+    __slots__ = (
+        "policy",
+        "tokens",
+        "updated",
+        "in_flight",
+        "not_before",
+        "crawl_delay",
+        "waiters",
+    )
+
+    def __init__(self, policy: HostPolicy):
+        self.policy = policy
+        self.tokens = float(policy.burst)
+        self.updated = monotonic()
+        self.in_flight = 0
+        self.not_before = 0.0
+        self.crawl_delay = 0.0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    def rate(self) -> float:
+        if self.crawl_delay:
+            return min(self.policy.rate, 1.0 / self.crawl_delay)
+        return self.policy.rate
+
+    def burst(self) -> float:
+        return 1.0 if self.crawl_delay else float(self.policy.burst)
+
+    def time_until_token(self, now: float) -> float:
+        self.tokens = min(
+            self.burst(), self.tokens + (now - self.updated) * self.rate()
+        )
+        self.updated = now
+        if self.not_before > now:
+            return self.not_before - now
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate()
+
+
+class HostScheduler:
+    """
+    Paces requests per host with a token bucket and an in-flight cap, honours
+    Crawl-delay and Retry-After, and hands out free slots round-robin across
+    hosts so one busy site cannot starve the others
+    """
+
+    def __init__(
+        self,
+        policy: HostPolicy = None,
+        max_in_flight: int = 64,
+        host_policies: Dict[str, HostPolicy] = None,
+    ):
+        self.policy = policy or HostPolicy()
+        self.max_in_flight = max_in_flight
+        self.host_policies = host_policies or {}
+        self._hosts: Dict[str, _HostState] = {}
+        self._rotation: Deque[str] = deque()
+        self._queued = set()
+        self._in_flight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _state(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = _HostState(self.host_policies.get(host, self.policy))
+            self._hosts[host] = state
+        return state
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        host = get_host(url)
+        await self.acquire(host)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    async def acquire(self, host: str):
+        state = self._state(host)
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        if host not in self._queued:
+            self._queued.add(host)
+            self._rotation.append(host)
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # granted and cancelled in the same tick: give the slot back
+                self.release(host)
+            raise
+
+    def release(self, host: str):
+        self._hosts[host].in_flight -= 1
+        self._in_flight -= 1
+        self._dispatch()
+
+    def set_crawl_delay(self, host: str, crawl_delay: Optional[float]):
+        self._state(host).crawl_delay = crawl_delay or 0.0
+
+    def back_off(self, host: str, seconds: Optional[float] = None):
+        state = self._state(host)
+        if seconds is None:
+            seconds = state.policy.default_backoff
+        state.not_before = max(state.not_before, monotonic() + seconds)
+        # drop the burst so traffic resumes at the sustained rate
+        state.tokens = 0.0
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        next_check = None
+        granted = True
+        while granted and self._rotation:
+            granted = False
+            for _ in range(len(self._rotation)):
+                if self._in_flight >= self.max_in_flight:
+                    return
+                host = self._rotation.popleft()
+                state = self._hosts[host]
+                while state.waiters and state.waiters[0].done():
+                    state.waiters.popleft()
+                if not state.waiters:
+                    self._queued.discard(host)
+                    continue
+                self._rotation.append(host)
+                if state.in_flight >= state.policy.max_in_flight:
+                    # release() dispatches again
+                    continue
+                wait = state.time_until_token(monotonic())
+                if wait > 0:
+                    next_check = wait if next_check is None else min(next_check, wait)
+                    continue
+
+                state.tokens -= 1.0
+                state.in_flight += 1
+                self._in_flight += 1
+                state.waiters.popleft().set_result(None)
+                granted = True
+
+        if next_check is not None:
+            self._timer = asyncio.get_running_loop().call_later(
+                next_check, self._dispatch
+            )
@@ -0,0 +1,149 @@
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+NLTK_DATA_DIR = os.path.expanduser("~/nltk_data")
+SEGMENTER_ENV = "SENTENCE_SEGMENTER"
+SEGMENTERS = ("punkt", "rules")
+
+# words that end in a period without ending the sentence
+ABBREVIATIONS = frozenset(
+    "mr mrs ms dr prof sr jr st mt vs etc inc ltd co corp gov gen sen rep rev "
+    "jan feb mar apr jun jul aug sep sept oct nov dec no fig al approx dept est".split()
+)
+SENTENCE_END = re.compile(r"""[.!?]+["'”’)\]]*(?=\s+["'“‘(\[]?[A-Z0-9])""")
+PRECEDING_WORD = re.compile(r"[\w.]+$")
+END_MARK = re.compile(r"[.!?]")
+# a sentence end whose next word has not arrived yet
+TRAILING_END = re.compile(r"""[.!?]["'”’)\]]*\s*$""")
+
+_punkt: Dict[str, Any] = {}
+_punkt_lock = threading.Lock()
+
+
+def add_nltk_data_path(path: str = NLTK_DATA_DIR):
+    """
+    Make nltk look for resources in `path` as well; a no-op when it already
+    does
+    """
+    import nltk
+
+    if path not in nltk.data.path:
+        nltk.data.path.append(path)
+
+
+def get_punkt(language: str = "english"):
+    """
+    Process-wide Punkt tokenizer per language, loaded on first use
+    """
+    tokenizer = _punkt.get(language)
+    if tokenizer is not None:
+        return tokenizer
+
+    with _punkt_lock:
+        tokenizer = _punkt.get(language)
+        if tokenizer is None:
+            add_nltk_data_path()
+            try:
+                # nltk >= 3.8.2 ships the parameters as punkt_tab, not pickles
+                from nltk.tokenize.punkt import PunktTokenizer
+            except ImportError:
+                import nltk
+
+                tokenizer = nltk.data.load(f"tokenizers/punkt/{language}.pickle")
+            else:
+                tokenizer = PunktTokenizer(language)
+            _punkt[language] = tokenizer
+    return tokenizer
+
+
+def _is_abbreviation(text: str, end: int) -> bool:
+    match = PRECEDING_WORD.search(text, max(0, end - 32), end)
+    if match is None:
+        return False
+    word = match.group().lower()
+    # initials ("J. R. R.") and dotted abbreviations ("U.S.", "e.g.")
+    return word in ABBREVIATIONS or (len(word) == 1 and word.isalpha()) or "." in word
+
+
+def split_rules(text: str) -> List[str]:
+    """
+    Regex segmenter: a sentence ends at . ! or ? (plus closing quotes and
+    brackets) followed by whitespace and a capital or a digit, unless the
+    period belongs to an abbreviation or an initial. About three times as
+    fast as Punkt
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        if match.group().startswith(".") and _is_abbreviation(text, match.start()):
+            continue
+        sentence = text[start : match.end()].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    tail = text[start:].strip()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+
+def get_splitter(
+    method: str = "punkt", language: str = "english"
+) -> Callable[[str], List[str]]:
+    if method == "punkt":
+        return get_punkt(language).tokenize
+    if method == "rules":
+        return split_rules
+    raise ValueError(f"sentence segmenter must be one of {SEGMENTERS}, not {method}")
+
+
+def segment(text: str, method: str = "punkt", language: str = "english") -> List[str]:
+    """
+    nltk.sent_tokenize without the per-call resource lookup, or the rule-based
+    segmenter
+    """
+    return get_splitter(method, language)(text)
+
+
+class SentenceSegmenter:
+    """
+    Segments text that arrives in pieces. feed() returns the sentences that
+    are settled and keeps the last two back: the next piece may continue the
+    last one, and Punkt may then move closing quotes and brackets across the
+    boundary before it. close() returns the rest
+    """
+
+    def __init__(self, method: str = "punkt", language: str = "english"):
+        self._split = get_splitter(method, language)
+        self._buffer = ""
+        self._open_end = False
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        # no new place a sentence could end: skip splitting the buffer again
+        if not self._open_end and not END_MARK.search(text):
+            return []
+        self._open_end = TRAILING_END.search(self._buffer) is not None
+        sentences = self._split(self._buffer)
+        if len(sentences) < 3:
+            return []
+        last = self._buffer.rindex(sentences[-1])
+        self._buffer = self._buffer[self._buffer.rindex(sentences[-2], 0, last) :]
+        return sentences[:-2]
+
+    def close(self) -> List[str]:
+        sentences = self._split(self._buffer)
+        self._buffer = ""
+        self._open_end = False
+        return sentences
+
+
+def iter_sentences(
+    pieces: Iterable[str], method: str = "punkt", language: str = "english"
+) -> Iterator[str]:
+    segmenter = SentenceSegmenter(method, language)
+    for piece in pieces:
+        yield from segmenter.feed(piece)
+    yield from segmenter.close()
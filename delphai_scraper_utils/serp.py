@@ -0,0 +1,184 @@
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from .utils import is_truncated
+
+Path = Tuple[str, ...]
+
+
+class Snippet:
+    """
+    One search snippet. Supports the dict-style access (`snippet["title"]`,
+    `.get`) the ranking and title code uses, and to_dict() for the output
+    """
+
+    __slots__ = (
+        "snippet",
+        "link",
+        "title",
+        "date",
+        "domain",
+        "query",
+        "src",
+        "relevancy",
+        "article",
+    )
+    # set later in the pipeline, only written out once they are
+    OPTIONAL_FIELDS = ("relevancy", "article")
+
+    def __init__(
+        self,
+        snippet: Any,
+        link: Optional[str],
+        title: Optional[str],
+        date: Optional[str],
+        domain: Optional[str],
+        query: str,
+        src: str,
+    ):
+        self.snippet = snippet
+        self.link = link
+        self.title = title
+        self.date = date
+        self.domain = domain
+        self.query = query
+        self.src = src
+        self.relevancy = None
+        self.article = None
+
+    def __getitem__(self, field: str) -> Any:
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def __setitem__(self, field: str, value: Any):
+        try:
+            setattr(self, field, value)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def get(self, field: str, default: Any = None) -> Any:
+        value = getattr(self, field, None)
+        return default if value is None else value
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = {
+            field: getattr(self, field)
+            for field in self.__slots__
+            if field not in self.OPTIONAL_FIELDS
+        }
+        for field in self.OPTIONAL_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                record[field] = value
+        return record
+
+    def __repr__(self) -> str:
+        return f"Snippet({self.to_dict()!r})"
+
+
+class SnippetRule(NamedTuple):
+    src: str
+    # where the snippet text sits, relative to the result or to each entry
+    # of `each`
+    text: Path
+    # list of sub-results, each producing a snippet
+    each: Optional[Path] = None
+    # whether those sub-results link somewhere else than the result itself
+    entry_link: bool = True
+    # emit on an empty text as long as it is present
+    keep_empty: bool = False
+    join: bool = False
+    # only applies when this path of the result is present
+    requires: Optional[Path] = None
+
+
+# order matters: snippets are emitted per result in rule order
+RULES = (
+    SnippetRule("organic_results", text=("snippet",)),
+    SnippetRule("nested_results", text=("snippet",), each=("nested_results",)),
+    SnippetRule(
+        "rich_snippet/extensions",
+        text=("rich_snippet", "top", "extensions"),
+        keep_empty=True,
+        join=True,
+    ),
+    SnippetRule(
+        "rich_snippet/attributes_flat",
+        text=("rich_snippet", "top", "attributes_flat"),
+        keep_empty=True,
+    ),
+    # FAQ answers have always been read only for results with flat attributes
+    SnippetRule(
+        "faq",
+        text=("answer",),
+        each=("faq",),
+        entry_link=False,
+        keep_empty=True,
+        requires=("rich_snippet", "top", "attributes_flat"),
+    ),
+)
+
+
+def dig(tree: Any, path: Path) -> Any:
+    """
+    get_maybe without the Maybe: the value at path, or None
+    """
+    for key in path:
+        try:
+            tree = tree[key]
+        except (TypeError, IndexError, KeyError):
+            return None
+    return tree
+
+
+class ParsedSerp(NamedTuple):
+    query: Optional[str]
+    snippets: List[Snippet]
+    # distinct links whose title is cut off, in order of appearance
+    truncated_links: List[str]
+
+
+def parse_serp(response: Dict[str, Any], rules=RULES) -> ParsedSerp:
+    """
+    Snippets of a ScaleSERP response, walking each organic result once and
+    applying `rules` to it
+    """
+    query = dig(response, ("search_parameters", "q"))
+    if query is None:
+        logging.info("ERROR getting snippets")
+        return ParsedSerp(None, [], [])
+
+    snippets = []
+    truncated_links = {}
+    for result in response.get("organic_results") or ():
+        title = result.get("title")
+        date = result.get("date")
+        domain = result.get("domain")
+        result_link = result.get("link")
+        truncated = is_truncated(title)
+        for rule in rules:
+            if rule.requires is not None and dig(result, rule.requires) is None:
+                continue
+            if rule.each is None:
+                found = ((dig(result, rule.text), result_link),)
+            else:
+                found = (
+                    (
+                        dig(entry, rule.text),
+                        entry.get("link") if rule.entry_link else result_link,
+                    )
+                    for entry in dig(result, rule.each) or ()
+                )
+            for text, link in found:
+                if text is None or not (text or rule.keep_empty):
+                    continue
+                if rule.join:
+                    text = " ".join(text)
+                snippets.append(
+                    Snippet(text, link, title, date, domain, query, rule.src)
+                )
+                if truncated and link:
+                    truncated_links[link] = None
+    return ParsedSerp(query, snippets, list(truncated_links))
@@ -0,0 +1,38 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Concurrent calls for the same key share a single in-flight call. The
+    shared call is shielded, so one cancelled caller does not cancel it for
+    everybody else
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(
+        self, key: Hashable, fn: Callable[[], Awaitable[T]]
+    ) -> Tuple[T, bool]:
+        """
+        Returns the result and whether it came from another caller's call
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future), True
+
+        future = asyncio.ensure_future(fn())
+        self._calls[key] = future
+
+        def forget(done: asyncio.Future):
+            if self._calls.get(key) is done:
+                del self._calls[key]
+
+        future.add_done_callback(forget)
+        return await asyncio.shield(future), False
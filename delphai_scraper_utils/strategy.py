@@ -0,0 +1,162 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, Optional
+
+from .metrics import fetch_strategy_finished, fetch_strategy_won
+from .page import Page, PageRejectedError
+
+# direct fetch: (url, on_sent, on_headers) -> Page
+DirectFetch = Callable[[str, Callable[[], None], Callable[[], None]], Awaitable[Page]]
+# paid fetch: url -> Page or None
+PaidFetch = Callable[[str], Awaitable[Optional[Page]]]
+
+
+@dataclass
+class PaidFetchPolicy:
+    # seconds the direct fetch gets to produce response headers, counted from
+    # when the request is sent, before the paid copy is requested in parallel
+    hedge_delay: float = 5.0
+    # hard cap on paid fetches for the lifetime of the cascade
+    max_calls: Optional[int] = None
+    # cap on paid fetches as a share of all fetches, applied once
+    # `min_fetches` fetches have been seen
+    max_share: float = 0.25
+    min_fetches: int = 20
+
+
+class PaidFetchBudget:
+    def __init__(self, policy: PaidFetchPolicy):
+        self.policy = policy
+        self.fetches = 0
+        self.paid_calls = 0
+
+    def record_fetch(self):
+        self.fetches += 1
+
+    def try_spend(self) -> bool:
+        max_calls = self.policy.max_calls
+        if max_calls is not None and self.paid_calls >= max_calls:
+            return False
+        if (
+            self.fetches >= self.policy.min_fetches
+            and self.paid_calls >= self.policy.max_share * self.fetches
+        ):
+            return False
+        self.paid_calls += 1
+        return True
+
+
+class FetchCascade:
+    """
+    Direct fetch with a delayed hedge to a paid cached copy: when the origin
+    has not sent headers within `hedge_delay` of receiving the request (time
+    spent on robots.txt or waiting for the host scheduler does not count),
+    the paid fetch starts in parallel and whichever returns a page first
+    wins. A failed direct fetch
+    falls back to the paid one, unless the page was rejected outright
+    (PageRejectedError), which also cancels a paid fetch already running.
+    Robots.txt disallows and HTTP error statuses come back as pages and win
+    as such. Paid calls are capped by PaidFetchBudget
+    """
+
+    def __init__(
+        self,
+        direct: DirectFetch,
+        paid: PaidFetch,
+        policy: PaidFetchPolicy = None,
+        scraper_id: Optional[str] = None,
+    ):
+        self.direct = direct
+        self.paid = paid
+        self.policy = policy or PaidFetchPolicy()
+        self.budget = PaidFetchBudget(self.policy)
+        self.scraper_id = scraper_id
+
+    async def _run(self, strategy: str, fetch: Awaitable[Optional[Page]]):
+        started = perf_counter()
+        page = await fetch
+        if page is not None:
+            fetch_strategy_finished(
+                scraper_id=self.scraper_id,
+                strategy=strategy,
+                latency=perf_counter() - started,
+            )
+        return page
+
+    def _won(self, strategy: str, page: Optional[Page]) -> Optional[Page]:
+        fetch_strategy_won(
+            scraper_id=self.scraper_id, strategy=strategy if page else "none"
+        )
+        return page
+
+    async def fetch(self, url: str) -> Optional[Page]:
+        self.budget.record_fetch()
+        request_sent = asyncio.Event()
+        headers_received = asyncio.Event()
+        direct = asyncio.ensure_future(
+            self._run(
+                "direct", self.direct(url, request_sent.set, headers_received.set)
+            )
+        )
+        sent_waiter = asyncio.ensure_future(request_sent.wait())
+        headers_waiter = asyncio.ensure_future(headers_received.wait())
+        try:
+            # we may be pacing the host ourselves: only a slow server is
+            # hedged against
+            await asyncio.wait(
+                {direct, sent_waiter}, return_when=asyncio.FIRST_COMPLETED
+            )
+            await asyncio.wait(
+                {direct, headers_waiter},
+                timeout=self.policy.hedge_delay,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not direct.done() and not headers_received.is_set():
+                if self.budget.try_spend():
+                    return await self._race(url, direct)
+
+            try:
+                page = await direct
+            except PageRejectedError:
+                raise
+            except Exception as ex:
+                logging.info(f"[fetch] direct fetch failed for {url}: {repr(ex)}")
+                page = None
+            if page is not None:
+                return self._won("direct", page)
+
+            if not self.budget.try_spend():
+                logging.info(f"[fetch] paid fetch budget spent, skipping {url}")
+                return self._won("paid", None)
+            return self._won("paid", await self._run("paid", self.paid(url)))
+        finally:
+            sent_waiter.cancel()
+            headers_waiter.cancel()
+            direct.cancel()
+
+    async def _race(self, url: str, direct: asyncio.Future) -> Optional[Page]:
+        paid = asyncio.ensure_future(self._run("paid", self.paid(url)))
+        strategies: Dict[asyncio.Future, str] = {direct: "direct", paid: "paid"}
+        pending = set(strategies)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if isinstance(task.exception(), PageRejectedError):
+                        # not a document the paid copy could improve on
+                        raise task.exception()
+                    if task.exception() is not None:
+                        logging.info(
+                            f"[fetch] {strategies[task]} fetch failed for {url}: "
+                            f"{repr(task.exception())}"
+                        )
+                    elif task.result() is not None:
+                        return self._won(strategies[task], task.result())
+            return self._won("paid", None)
+        finally:
+            for task in pending:
+                task.cancel()
@@ -0,0 +1,359 @@
+import asyncio
+import ipaddress
+import logging
+import socket
+import ssl
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+from time import monotonic, perf_counter
+from typing import Deque, Dict, List, Optional, Tuple
+
+import httpcore
+import httpx
+from httpx import Limits
+
+from .metrics import connection_handshake
+from .singleflight import SingleFlight
+
+
+@dataclass
+class CrawlProfile:
+    """
+    Transport settings for crawls that touch many hosts once or twice rather
+    than a few hosts many times
+    """
+
+    # negotiated through ALPN, origins without HTTP/2 stay on HTTP/1.1
+    http2: bool = True
+    max_connections: int = 256
+    max_keepalive_connections: int = 64
+    keepalive_expiry: float = 15.0
+    # idle connections kept open per host, most crawled hosts are not revisited
+    max_idle_per_host: int = 1
+    host_max_idle: Dict[str, int] = field(default_factory=dict)
+    dns_ttl: float = 300.0
+    dns_max_entries: int = 10_000
+
+    def limits(self) -> Limits:
+        return Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def idle_limit(self, host: str) -> int:
+        return self.host_max_idle.get(host, self.max_idle_per_host)
+
+
+@dataclass
+class PoolStats:
+    connections: int
+    idle: int
+    active: int
+    http2: int
+    # open connections per host
+    hosts: Dict[str, int]
+    requests: int
+    new_connections: int
+    reuse_ratio: float
+    # mean seconds per new connection spent resolving, then in the tcp and
+    # tls handshakes
+    dns_time: float
+    connect_time: float
+    tls_time: float
+    dns_hits: int
+    dns_misses: int
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def is_ip_address(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host.strip("[]"))
+    except ValueError:
+        return False
+    return True
+
+
+_ssl_contexts: Dict[Tuple, ssl.SSLContext] = {}
+
+
+def shared_ssl_context(verify=True, cert=None, trust_env: bool = True, http2=False):
+    """
+    One SSLContext per configuration for the whole process, so the CA bundle
+    is loaded once rather than per client
+    """
+    if isinstance(verify, ssl.SSLContext):
+        return verify
+    key = (verify, cert, trust_env, http2)
+    context = _ssl_contexts.get(key)
+    if context is None:
+        context = httpx.create_ssl_context(
+            cert=cert, verify=verify, trust_env=trust_env, http2=http2
+        )
+        _ssl_contexts[key] = context
+    return context
+
+
+class DnsCache:
+    """
+    Resolved addresses per (host, port) for a fixed TTL, since the system
+    resolver gives no TTL. Concurrent lookups of one host share a resolution
+    """
+
+    def __init__(self, ttl: float = 300.0, max_entries: int = 10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, List[str]]]" = (
+            OrderedDict()
+        )
+        self._in_flight = SingleFlight()
+
+    async def resolve(self, host: str, port: int) -> List[str]:
+        key = (host, port)
+        entry = self._entries.get(key)
+        if entry is not None and monotonic() - entry[0] <= self.ttl:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        addresses, _ = await self._in_flight.do(key, lambda: self._lookup(host, port))
+        return addresses
+
+    async def _lookup(self, host: str, port: int) -> List[str]:
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                host, port, type=socket.SOCK_STREAM
+            )
+        except OSError as ex:
+            raise httpcore.ConnectError(f"{host}: {ex}") from ex
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self._entries[(host, port)] = (monotonic(), addresses)
+        self._entries.move_to_end((host, port))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return addresses
+
+    def forget(self, host: str, port: int):
+        self._entries.pop((host, port), None)
+
+
+class _TrackedStream(httpcore.AsyncNetworkStream):
+    def __init__(self, stream, backend: "CrawlNetworkBackend", host: str):
+        self._stream = stream
+        self._backend = backend
+        self._host = host
+        self._closed = False
+
+    async def read(self, max_bytes: int, timeout: Optional[float] = None) -> bytes:
+        return await self._stream.read(max_bytes, timeout)
+
+    async def write(self, buffer: bytes, timeout: Optional[float] = None):
+        await self._stream.write(buffer, timeout)
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            self._backend.connection_closed(self._host)
+        await self._stream.aclose()
+
+    async def start_tls(
+        self,
+        ssl_context: ssl.SSLContext,
+        server_hostname: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ):
+        started = perf_counter()
+        self._stream = await self._stream.start_tls(
+            ssl_context, server_hostname, timeout
+        )
+        self._backend.record_handshake("tls", perf_counter() - started)
+        return self
+
+    def get_extra_info(self, info: str):
+        return self._stream.get_extra_info(info)
+
+
+class CrawlNetworkBackend(httpcore.AsyncNetworkBackend):
+    """
+    Wraps httpcore's network backend to resolve hosts through a DnsCache and
+    to time and count the connections the pool opens
+    """
+
+    def __init__(
+        self,
+        backend: httpcore.AsyncNetworkBackend,
+        dns_cache: DnsCache,
+        scraper_id: str = None,
+        handshake_samples: int = 1000,
+    ):
+        self.backend = backend
+        self.dns_cache = dns_cache
+        self.scraper_id = scraper_id
+        self.new_connections = 0
+        self.open_connections: Counter = Counter()
+        self.handshakes: Dict[str, Deque[float]] = {
+            phase: deque(maxlen=handshake_samples) for phase in ("dns", "tcp", "tls")
+        }
+
+    def record_handshake(self, phase: str, duration: float):
+        connection_handshake(
+            scraper_id=self.scraper_id, phase=phase, duration=duration
+        )
+        self.handshakes[phase].append(duration)
+
+    def mean_handshake(self, phase: str) -> float:
+        samples = self.handshakes[phase]
+        return sum(samples) / len(samples) if samples else 0.0
+
+    def connection_closed(self, host: str):
+        self.open_connections[host] -= 1
+        if self.open_connections[host] <= 0:
+            del self.open_connections[host]
+
+    async def connect_tcp(self, host: str, port: int, timeout=None, **kwargs):
+        if is_ip_address(host):
+            addresses = [host]
+        else:
+            started = perf_counter()
+            addresses = await self.dns_cache.resolve(host, port)
+            self.record_handshake("dns", perf_counter() - started)
+
+        started = perf_counter()
+        for index, address in enumerate(addresses):
+            try:
+                stream = await self.backend.connect_tcp(
+                    address, port, timeout=timeout, **kwargs
+                )
+                break
+            except (httpcore.ConnectError, httpcore.ConnectTimeout):
+                if index == len(addresses) - 1:
+                    # the cached addresses may be stale
+                    self.dns_cache.forget(host, port)
+                    raise
+        self.record_handshake("tcp", perf_counter() - started)
+        self.new_connections += 1
+        self.open_connections[host] += 1
+        return _TrackedStream(stream, self, host)
+
+    async def connect_unix_socket(self, path: str, timeout=None, **kwargs):
+        return await self.backend.connect_unix_socket(path, timeout=timeout, **kwargs)
+
+    async def sleep(self, seconds: float):
+        await self.backend.sleep(seconds)
+
+
+class CrawlConnectionPool(httpcore.AsyncConnectionPool):
+    """
+    httpcore pool that keeps at most CrawlProfile.idle_limit(host) idle
+    connections per origin, instead of only a pool-wide keep-alive cap
+    """
+
+    def __init__(self, profile: CrawlProfile, **kwargs):
+        super().__init__(**kwargs)
+        self.profile = profile
+
+    async def handle_async_request(
+        self, request: httpcore.Request
+    ) -> httpcore.Response:
+        await self._close_idle(request.url)
+        return await super().handle_async_request(request)
+
+    async def _close_idle(self, url: httpcore.URL):
+        origin = url.origin
+        keep = self.profile.idle_limit(origin.host.decode("ascii"))
+        for connection in self.connections:
+            if connection.is_idle() and connection.can_handle_request(origin):
+                if keep > 0:
+                    keep -= 1
+                else:
+                    # aclose() marks the connection closed before its first
+                    # await, so the pool cannot hand it out meanwhile and
+                    # drops it when it next assigns requests
+                    await connection.aclose()
+
+
+class CrawlTransport(httpx.AsyncHTTPTransport):
+    """
+    httpx transport configured from a CrawlProfile: HTTP/2 where the origin
+    offers it, a cached resolver, a per-host cap on idle keep-alive
+    connections and pool statistics
+    """
+
+    def __init__(
+        self,
+        profile: CrawlProfile = None,
+        verify=True,
+        cert=None,
+        trust_env: bool = True,
+        scraper_id: str = None,
+    ):
+        self.profile = profile or CrawlProfile()
+        http2 = self.profile.http2
+        if http2 and not http2_available():
+            logging.warning("[transport] h2 is not installed, using HTTP/1.1 only")
+            http2 = False
+        limits = self.profile.limits()
+        ssl_context = shared_ssl_context(verify, cert, trust_env, http2)
+        super().__init__(
+            verify=ssl_context,
+            http1=True,
+            http2=http2,
+            limits=limits,
+            trust_env=trust_env,
+        )
+        self.dns_cache = DnsCache(self.profile.dns_ttl, self.profile.dns_max_entries)
+        self.network_backend = CrawlNetworkBackend(
+            httpcore.AnyIOBackend(), self.dns_cache, scraper_id
+        )
+        # AsyncHTTPTransport has no hook for the pool it wraps; this builds
+        # the same pool it does, through httpcore's public constructor
+        self._pool = CrawlConnectionPool(
+            self.profile,
+            ssl_context=ssl_context,
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http1=True,
+            http2=http2,
+            network_backend=self.network_backend,
+        )
+        self.requests = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        return await super().handle_async_request(request)
+
+    def stats(self) -> PoolStats:
+        connections = list(self._pool.connections)
+        idle = sum(1 for connection in connections if connection.is_idle())
+        backend = self.network_backend
+        return PoolStats(
+            connections=len(connections),
+            idle=idle,
+            active=len(connections) - idle,
+            http2=sum(
+                1 for connection in connections if "HTTP/2" in connection.info()
+            ),
+            hosts=dict(backend.open_connections),
+            requests=self.requests,
+            new_connections=backend.new_connections,
+            reuse_ratio=(
+                max(0, self.requests - backend.new_connections) / self.requests
+                if self.requests
+                else 0.0
+            ),
+            dns_time=backend.mean_handshake("dns"),
+            connect_time=backend.mean_handshake("tcp"),
+            tls_time=backend.mean_handshake("tls"),
+            dns_hits=self.dns_cache.hits,
+            dns_misses=self.dns_cache.misses,
+        )
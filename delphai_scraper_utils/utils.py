@@ -1,9 +1,9 @@
 
+import asyncio
 import logging
-import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from dataclasses import dataclass
-from typing import Any, List, Dict, Union, Tuple
+from typing import Any, List, Dict, Optional, Union, Tuple
 
 # helper functions
 @dataclass
@@ -60,14 +60,48 @@ def remove_duplicates(snippets):
             unique_snippets[key] = snippet
     return list(unique_snippets.values())
 
-def get_full_title(url):
+def is_truncated(title: Optional[str]) -> bool:
+    return bool(title) and title.endswith("...")
+
+
+async def get_full_title(client, url: str) -> Optional[str]:
     try:
-        response = requests.get(url)
+        # through the page cache: truncated-title links are often the same
+        # pages that get fetched for their article text afterwards
+        response = await client.get_page(url, follow_redirects=True)
         if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            title_tag = soup.find('title')
+            soup = BeautifulSoup(
+                response.text, "html.parser", parse_only=SoupStrainer("title")
+            )
+            title_tag = soup.find("title")
             if title_tag:
                 return title_tag.get_text()
     except Exception as e:
         logging.info(f"Error fetching full title from {url}: {e}")
     return None
+
+
+async def resolve_full_titles(
+    client, snippets: List[Dict[str, Any]], links: Optional[List[str]] = None
+):
+    """
+    Replace titles cut off with "..." by the page <title>, fetching every
+    distinct link concurrently. `links` can be passed when the parser already
+    collected the links with truncated titles
+    """
+    if links is None:
+        links = list(
+            dict.fromkeys(
+                snippet["link"]
+                for snippet in snippets
+                if snippet["link"] and is_truncated(snippet["title"])
+            )
+        )
+    if not links:
+        return snippets
+    titles = await asyncio.gather(*(get_full_title(client, link) for link in links))
+    full_titles = {link: title for link, title in zip(links, titles) if title}
+    for snippet in snippets:
+        if is_truncated(snippet["title"]) and snippet["link"] in full_titles:
+            snippet["title"] = full_titles[snippet["link"]]
+    return snippets
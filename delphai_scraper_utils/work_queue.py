@@ -0,0 +1,552 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from time import time
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from .output import JsonlWriter
+from .pipeline import ClaimPipeline
+
+# task states
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+
+@dataclass
+class Lease:
+    task_id: str
+    payload: Dict[str, Any]
+    # 1 for the first delivery
+    attempt: int
+    token: str
+    expires_at: float
+
+
+class WorkQueue(ABC):
+    """
+    Tasks are leased to one worker at a time. A lease that is neither acked
+    nor extended within its visibility timeout expires and the task is handed
+    out again; after `max_attempts` deliveries a failing task is dead
+    """
+
+    def __init__(self, max_attempts: int = 3):
+        self.max_attempts = max_attempts
+
+    @abstractmethod
+    async def put_many(self, tasks: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """
+        Enqueue (task_id, payload) pairs, skipping ids that are already known;
+        returns how many were added
+        """
+
+    @abstractmethod
+    async def lease(self, count: int, visibility_timeout: float) -> List[Lease]:
+        ...
+
+    @abstractmethod
+    async def extend(self, lease: Lease, visibility_timeout: float) -> bool:
+        ...
+
+    @abstractmethod
+    async def ack(self, lease: Lease) -> bool:
+        ...
+
+    @abstractmethod
+    async def nack(self, lease: Lease, error: str) -> bool:
+        """
+        Give a failed task back, or mark it dead once it used up its attempts
+        """
+
+    @abstractmethod
+    async def counts(self) -> Dict[str, int]:
+        ...
+
+    async def is_drained(self) -> bool:
+        counts = await self.counts()
+        return counts.get(PENDING, 0) == 0 and counts.get(LEASED, 0) == 0
+
+
+class SqliteQueue(WorkQueue):
+    """
+    Queue in a SQLite file, for tests and for workers on one machine
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        super().__init__(max_attempts)
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                token TEXT,
+                leased_until REAL,
+                error TEXT
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state)")
+
+    def _transaction(self, fn: Callable[[], Any]):
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes
+        # cannot lease the same row
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn()
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def _put_many(self, tasks: List[Tuple[str, Dict[str, Any]]]) -> int:
+        def insert():
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO tasks (id, payload, state) VALUES (?, ?, ?)",
+                [
+                    (task_id, json.dumps(payload, ensure_ascii=False), PENDING)
+                    for task_id, payload in tasks
+                ],
+            )
+            return self._db.total_changes - before
+
+        return self._transaction(insert)
+
+    def _lease(self, count: int, visibility_timeout: float) -> List[Lease]:
+        def lease():
+            now = time()
+            # expired leases of tasks that used up their attempts are poison
+            self._db.execute(
+                "UPDATE tasks SET state = ?, error = 'lease expired' "
+                "WHERE state = ? AND leased_until < ? AND attempts >= ?",
+                (DEAD, LEASED, now, self.max_attempts),
+            )
+            rows = self._db.execute(
+                "SELECT id, payload, attempts FROM tasks "
+                "WHERE state = ? OR (state = ? AND leased_until < ?) LIMIT ?",
+                (PENDING, LEASED, now, count),
+            ).fetchall()
+            leases = []
+            for task_id, payload, attempts in rows:
+                lease = Lease(
+                    task_id=task_id,
+                    payload=json.loads(payload),
+                    attempt=attempts + 1,
+                    token=uuid.uuid4().hex,
+                    expires_at=now + visibility_timeout,
+                )
+                self._db.execute(
+                    "UPDATE tasks SET state = ?, attempts = ?, token = ?, "
+                    "leased_until = ? WHERE id = ?",
+                    (LEASED, lease.attempt, lease.token, lease.expires_at, task_id),
+                )
+                leases.append(lease)
+            return leases
+
+        return self._transaction(lease)
+
+    def _update_lease(self, lease: Lease, assignments: str, values: tuple) -> bool:
+        # only the current holder of the lease may change the task
+        def update():
+            cursor = self._db.execute(
+                f"UPDATE tasks SET {assignments} WHERE id = ? AND token = ? "
+                "AND state = ?",
+                (*values, lease.task_id, lease.token, LEASED),
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(update)
+
+    def _counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(
+                self._db.execute(
+                    "SELECT state, COUNT(*) FROM tasks GROUP BY state"
+                ).fetchall()
+            )
+
+    async def put_many(self, tasks: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        return await asyncio.to_thread(self._put_many, list(tasks))
+
+    async def lease(self, count: int, visibility_timeout: float) -> List[Lease]:
+        return await asyncio.to_thread(self._lease, count, visibility_timeout)
+
+    async def extend(self, lease: Lease, visibility_timeout: float) -> bool:
+        expires_at = time() + visibility_timeout
+        extended = await asyncio.to_thread(
+            self._update_lease, lease, "leased_until = ?", (expires_at,)
+        )
+        if extended:
+            lease.expires_at = expires_at
+        return extended
+
+    async def ack(self, lease: Lease) -> bool:
+        return await asyncio.to_thread(
+            self._update_lease, lease, "state = ?, token = NULL", (DONE,)
+        )
+
+    async def nack(self, lease: Lease, error: str) -> bool:
+        state = DEAD if lease.attempt >= self.max_attempts else PENDING
+        return await asyncio.to_thread(
+            self._update_lease,
+            lease,
+            "state = ?, token = NULL, error = ?",
+            (state, error),
+        )
+
+    async def counts(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self._counts)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class InMemoryRedis:
+    """
+    Local stand-in for the subset of redis.asyncio.Redis (with
+    decode_responses=True) that RedisQueue uses
+    """
+
+    def __init__(self):
+        self._lists: Dict[str, deque] = defaultdict(deque)
+        self._hashes: Dict[str, Dict[str, str]] = defaultdict(dict)
+        self._sorted_sets: Dict[str, Dict[str, float]] = defaultdict(dict)
+
+    async def lpush(self, name: str, *values: str) -> int:
+        self._lists[name].extendleft(values)
+        return len(self._lists[name])
+
+    async def rpop(self, name: str, count: Optional[int] = None):
+        items = self._lists[name]
+        if count is None:
+            return items.pop() if items else None
+        popped = [items.pop() for _ in range(min(count, len(items)))]
+        return popped or None
+
+    async def llen(self, name: str) -> int:
+        return len(self._lists[name])
+
+    async def hset(self, name: str, key: str = None, value: str = None, mapping=None):
+        fields = dict(mapping or {})
+        if key is not None:
+            fields[key] = value
+        added = sum(1 for field in fields if field not in self._hashes[name])
+        self._hashes[name].update({k: str(v) for k, v in fields.items()})
+        return added
+
+    async def hsetnx(self, name: str, key: str, value: str) -> bool:
+        if key in self._hashes[name]:
+            return False
+        self._hashes[name][key] = str(value)
+        return True
+
+    async def hget(self, name: str, key: str) -> Optional[str]:
+        return self._hashes[name].get(key)
+
+    async def hdel(self, name: str, *keys: str) -> int:
+        return sum(1 for key in keys if self._hashes[name].pop(key, None) is not None)
+
+    async def hincrby(self, name: str, key: str, amount: int = 1) -> int:
+        value = int(self._hashes[name].get(key, 0)) + amount
+        self._hashes[name][key] = str(value)
+        return value
+
+    async def hlen(self, name: str) -> int:
+        return len(self._hashes[name])
+
+    async def zadd(self, name: str, mapping: Dict[str, float]) -> int:
+        added = sum(1 for member in mapping if member not in self._sorted_sets[name])
+        self._sorted_sets[name].update(mapping)
+        return added
+
+    async def zrem(self, name: str, *members: str) -> int:
+        return sum(
+            1
+            for member in members
+            if self._sorted_sets[name].pop(member, None) is not None
+        )
+
+    async def zrangebyscore(self, name: str, min: float, max: float) -> List[str]:
+        return [
+            member
+            for member, score in sorted(
+                self._sorted_sets[name].items(), key=lambda item: item[1]
+            )
+            if min <= score <= max
+        ]
+
+    async def zcard(self, name: str) -> int:
+        return len(self._sorted_sets[name])
+
+
+class RedisQueue(WorkQueue):
+    """
+    Queue on Redis data structures under `prefix`: a pending list, a sorted
+    set of leases by deadline and hashes for payloads, attempts, lease tokens
+    and task states. Works with redis.asyncio.Redis(decode_responses=True) or
+    InMemoryRedis. The steps are not one transaction: a worker dying between
+    popping a task and recording its lease strands that task
+    """
+
+    def __init__(self, redis, prefix: str = "claims", max_attempts: int = 3):
+        super().__init__(max_attempts)
+        self.redis = redis
+        self.prefix = prefix
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}:{name}"
+
+    async def put_many(self, tasks: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        added = 0
+        for task_id, payload in tasks:
+            state = await self.redis.hget(self._key("state"), task_id)
+            if state not in (None, PENDING):
+                continue
+            await self.redis.hset(
+                self._key("payload"), task_id, json.dumps(payload, ensure_ascii=False)
+            )
+            if await self.redis.hsetnx(self._key("state"), task_id, PENDING):
+                await self.redis.lpush(self._key("pending"), task_id)
+                added += 1
+        return added
+
+    async def _requeue_expired(self, now: float):
+        for task_id in await self.redis.zrangebyscore(self._key("leases"), 0, now):
+            # zrem decides which worker requeues it
+            if not await self.redis.zrem(self._key("leases"), task_id):
+                continue
+            await self.redis.hdel(self._key("token"), task_id)
+            attempts = int(await self.redis.hget(self._key("attempts"), task_id) or 0)
+            if attempts >= self.max_attempts:
+                await self._finish(task_id, DEAD, "lease expired")
+            else:
+                await self.redis.hset(self._key("state"), task_id, PENDING)
+                await self.redis.lpush(self._key("pending"), task_id)
+
+    async def lease(self, count: int, visibility_timeout: float) -> List[Lease]:
+        now = time()
+        await self._requeue_expired(now)
+        task_ids = await self.redis.rpop(self._key("pending"), count) or []
+        leases = []
+        for task_id in task_ids:
+            lease = Lease(
+                task_id=task_id,
+                payload=json.loads(await self.redis.hget(self._key("payload"), task_id)),
+                attempt=await self.redis.hincrby(self._key("attempts"), task_id, 1),
+                token=uuid.uuid4().hex,
+                expires_at=now + visibility_timeout,
+            )
+            await self.redis.hset(self._key("token"), task_id, lease.token)
+            await self.redis.hset(self._key("state"), task_id, LEASED)
+            await self.redis.zadd(self._key("leases"), {task_id: lease.expires_at})
+            leases.append(lease)
+        return leases
+
+    async def _holds(self, lease: Lease) -> bool:
+        return await self.redis.hget(self._key("token"), lease.task_id) == lease.token
+
+    async def _finish(self, task_id: str, state: str, error: str = None):
+        await self.redis.hset(self._key("state"), task_id, state)
+        await self.redis.hdel(self._key("payload"), task_id)
+        if error is not None:
+            await self.redis.hset(self._key("error"), task_id, error)
+
+    async def extend(self, lease: Lease, visibility_timeout: float) -> bool:
+        if not await self._holds(lease):
+            return False
+        lease.expires_at = time() + visibility_timeout
+        await self.redis.zadd(self._key("leases"), {lease.task_id: lease.expires_at})
+        return True
+
+    async def ack(self, lease: Lease) -> bool:
+        if not await self._holds(lease):
+            return False
+        await self.redis.zrem(self._key("leases"), lease.task_id)
+        await self.redis.hdel(self._key("token"), lease.task_id)
+        await self._finish(lease.task_id, DONE)
+        return True
+
+    async def nack(self, lease: Lease, error: str) -> bool:
+        if not await self._holds(lease):
+            return False
+        await self.redis.zrem(self._key("leases"), lease.task_id)
+        await self.redis.hdel(self._key("token"), lease.task_id)
+        if lease.attempt >= self.max_attempts:
+            await self._finish(lease.task_id, DEAD, error)
+        else:
+            await self.redis.hset(self._key("state"), lease.task_id, PENDING)
+            await self.redis.lpush(self._key("pending"), lease.task_id)
+        return True
+
+    async def counts(self) -> Dict[str, int]:
+        return {
+            PENDING: await self.redis.llen(self._key("pending")),
+            LEASED: await self.redis.zcard(self._key("leases")),
+        }
+
+
+def open_queue(url: str, max_attempts: int = 3) -> WorkQueue:
+    """
+    sqlite:///path/to/queue.sqlite, redis://host:port/db or memory://
+    """
+    if url.startswith("sqlite:///"):
+        return SqliteQueue(url[len("sqlite:///") :], max_attempts)
+    if url.startswith("memory://"):
+        return RedisQueue(InMemoryRedis(), max_attempts=max_attempts)
+    if url.startswith(("redis://", "rediss://")):
+        try:
+            import redis.asyncio
+        except ImportError as ex:
+            raise ImportError("a redis:// work queue needs the redis package") from ex
+        return RedisQueue(
+            redis.asyncio.from_url(url, decode_responses=True),
+            max_attempts=max_attempts,
+        )
+    raise ValueError(f"unknown work queue url: {url}")
+
+
+async def fill_queue(
+    queue: WorkQueue,
+    claims: Union[Iterable[Dict[str, Any]], AsyncIterable[Dict[str, Any]]],
+    id_field: str = "claim_id",
+    batch_size: int = 1000,
+) -> int:
+    added = 0
+    batch = []
+
+    async def flush():
+        nonlocal added, batch
+        added += await queue.put_many(batch)
+        batch = []
+
+    if hasattr(claims, "__aiter__"):
+        async for claim in claims:
+            batch.append((str(claim[id_field]), claim))
+            if len(batch) >= batch_size:
+                await flush()
+    else:
+        for claim in claims:
+            batch.append((str(claim[id_field]), claim))
+            if len(batch) >= batch_size:
+                await flush()
+    await flush()
+    return added
+
+
+class QueueWorker:
+    """
+    Leases claims from a WorkQueue, runs them through a ClaimPipeline and
+    appends the results to a JsonlWriter. Leases are extended while their
+    claims are queued or running; a claim is acked once its result is
+    flushed, and a claim whose processing raises is nacked for a retry
+    """
+
+    def __init__(
+        self,
+        queue: WorkQueue,
+        pipeline: ClaimPipeline,
+        writer: JsonlWriter,
+        visibility_timeout: float = 300.0,
+        lease_batch: int = 8,
+        poll_interval: float = 5.0,
+    ):
+        self.queue = queue
+        self.pipeline = pipeline
+        self.writer = writer
+        self.visibility_timeout = visibility_timeout
+        self.lease_batch = lease_batch
+        self.poll_interval = poll_interval
+        self._leases: Dict[str, Lease] = {}
+        # JsonlWriter is not thread-safe and every claim writes from its own
+        # to_thread call: a flush racing an append would checkpoint without
+        # the appended record, whose lease is then acked anyway
+        self._write_lock = asyncio.Lock()
+
+    async def _leased(self) -> AsyncIterator[Lease]:
+        while True:
+            leases = await self.queue.lease(self.lease_batch, self.visibility_timeout)
+            if not leases:
+                if await self.queue.is_drained():
+                    return
+                # other workers still hold leases that may expire
+                await asyncio.sleep(self.poll_interval)
+                continue
+            for lease in leases:
+                self._leases[lease.task_id] = lease
+            for lease in leases:
+                if self.writer.is_done(lease.task_id):
+                    # written by this worker before a crash, but never acked
+                    self._leases.pop(lease.task_id)
+                    await self.queue.ack(lease)
+                    continue
+                yield lease
+
+    async def _keep_leases(self):
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            for lease in list(self._leases.values()):
+                if not await self.queue.extend(lease, self.visibility_timeout):
+                    logging.info(f"[queue] lost the lease on {lease.task_id}")
+
+    async def _process(
+        self, lease: Lease, process: Callable[[Dict[str, Any]], Awaitable[Any]]
+    ):
+        try:
+            result = await process(lease.payload)
+            async with self._write_lock:
+                await asyncio.to_thread(self.writer.write, result)
+                await asyncio.to_thread(self.writer.flush)
+                await self.queue.ack(lease)
+        except Exception as ex:
+            logging.info(
+                f"[queue] {lease.task_id} failed on attempt {lease.attempt}: "
+                f"{repr(ex)}"
+            )
+            await self.queue.nack(lease, repr(ex))
+        finally:
+            self._leases.pop(lease.task_id, None)
+
+    async def run(self, process: Callable[[Dict[str, Any]], Awaitable[Any]]):
+        keeper = asyncio.ensure_future(self._keep_leases())
+        try:
+            async for _ in self.pipeline.run(
+                self._leased(), lambda lease: self._process(lease, process)
+            ):
+                pass
+        finally:
+            keeper.cancel()
@@ -1,31 +1,87 @@
 import os
-import json
-import requests
 import logging
 import urllib
 import asyncio
-import pandas as pd
-
-import trafilatura
-from newspaper import Article
-
-import nltk
-from nltk.tokenize import sent_tokenize
+import socket
+import sys
 
 from tqdm import tqdm
-from sentence_transformers import SentenceTransformer, util
-from bs4 import BeautifulSoup
 from dataclasses import dataclass
 from typing import Any, List, Dict, Union, Tuple
 from delphai_scraper_utils import ScraperClient
-from delphai_scraper_utils.deboilerplating import get_text_from_html
-from delphai_scraper_utils.utils import Maybe, get_maybe, remove_duplicates, get_full_title
+from delphai_scraper_utils.cache import (
+    DAY,
+    CacheStore,
+    HttpCache,
+    SearchCache,
+    TextCache,
+    get_success,
+)
+from delphai_scraper_utils.claims import ClaimSource
+from delphai_scraper_utils.extraction import ExtractionExecutor
+from delphai_scraper_utils.dedup import dedupe_snippets
+from delphai_scraper_utils.batching import EmbeddingBatcher
+from delphai_scraper_utils.embedding_store import EmbeddingStore
+from delphai_scraper_utils.embeddings import DEFAULT_MODEL_NAME, select_backend, warm_up
+from delphai_scraper_utils.page import Page, PageRejectedError
+from delphai_scraper_utils.output import JsonlWriter, convert_to_json
+from delphai_scraper_utils.pipeline import ClaimPipeline, ConcurrencyLimits
+from delphai_scraper_utils.registry import ArticleRegistry
+from delphai_scraper_utils.relevancy import (
+    near_threshold,
+    rank_snippets_async,
+    score_snippets_async,
+    select_relevant,
+)
+from delphai_scraper_utils.robots import RobotsCache
+from delphai_scraper_utils.scheduler import HostPolicy, HostScheduler
+from delphai_scraper_utils.serp import parse_serp
+from delphai_scraper_utils.strategy import FetchCascade, PaidFetchPolicy
+from delphai_scraper_utils.transport import CrawlProfile
+from delphai_scraper_utils.work_queue import QueueWorker, fill_queue, open_queue
+from delphai_scraper_utils.utils import resolve_full_titles
 
 SCALESERP_KEY = "API-KEY"
 SCRAPER_ID = "google_search"
 SIMILARITY_THRESHOLD = 0.6
 TOP_N = 15
-httpx_client = ScraperClient(scraper_id=SCRAPER_ID)
+# truncated titles are resolved for snippets scored this close to the threshold
+TITLE_MARGIN = 0.05
+CONCURRENCY_LIMITS = ConcurrencyLimits(
+    claims=int(os.getenv("MAX_CONCURRENT_CLAIMS", 8)),
+    requests=int(os.getenv("MAX_CONCURRENT_REQUESTS", 32)),
+    requests_per_claim=int(os.getenv("MAX_REQUESTS_PER_CLAIM", 4)),
+    requests_per_domain=int(os.getenv("MAX_REQUESTS_PER_DOMAIN", 2)),
+)
+CACHE_DIR = os.getenv("SCRAPER_CACHE_DIR", "./cache")
+SHARD = int(os.getenv("SHARD", 0))
+NUM_SHARDS = int(os.getenv("NUM_SHARDS", 1))
+
+def env_list(name: str):
+    value = os.getenv(name)
+    return value.split(",") if value else None
+
+CLAIMS_STOP = os.getenv("CLAIMS_STOP", "3")  # mini size for testing, "" for all
+CLAIM_SOURCE = ClaimSource(
+    os.getenv("CLAIMS_PATH", "./claim_dataset.csv"),
+    start=int(os.getenv("CLAIMS_START", 0)),
+    stop=int(CLAIMS_STOP) if CLAIMS_STOP else None,
+    sources=env_list("CLAIMS_SOURCES"),
+    labels=env_list("CLAIMS_LABELS"),
+    shard=SHARD,
+    num_shards=NUM_SHARDS,
+)
+# sqlite:///path, redis://host:port/db or memory://; unset for a local run
+WORK_QUEUE = os.getenv("WORK_QUEUE")
+# one record per claim, a `.gz` suffix compresses it; one file per shard or
+# queue worker
+if WORK_QUEUE:
+    DEFAULT_OUTPUT_PATH = f"./output/exp_request_output.{socket.gethostname()}.jsonl"
+elif NUM_SHARDS > 1:
+    DEFAULT_OUTPUT_PATH = f"./output/exp_request_output.{SHARD}-of-{NUM_SHARDS}.jsonl"
+else:
+    DEFAULT_OUTPUT_PATH = "./output/exp_request_output.jsonl"
+OUTPUT_PATH = os.getenv("SCRAPER_OUTPUT", DEFAULT_OUTPUT_PATH)
 
 #os.environ['NLTK_DATA'] = '/Users/ycyang/nltk_data/tokenizers/punkt'
 os.environ['NLTK_DATA'] = os.path.expanduser('~/nltk_data')
@@ -38,6 +94,74 @@ DEFAULT_CRAWL_HEADERS = {
     "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36",
 }
 
+def setup():
+    """
+    Caches, HTTP client and extraction pool. Only run when draft.py is the
+    script: spawned extraction workers import it as __mp_main__ and must not
+    open the caches or load anything of their own
+    """
+    global http_cache, text_cache, search_cache, robots_cache
+    global embedding_store, embedding_batcher, scheduler, httpx_client
+    global extraction_executor, article_registry, fetch_cascade
+
+    http_cache = HttpCache(
+        CacheStore(
+            os.path.join(CACHE_DIR, "http.sqlite"), ttl=7 * DAY, max_bytes=4 * 1024**3
+        )
+    )
+    text_cache = TextCache(
+        CacheStore(os.path.join(CACHE_DIR, "text.sqlite"), max_bytes=1024**3)
+    )
+    search_cache = SearchCache(
+        CacheStore(os.path.join(CACHE_DIR, "search.sqlite"), ttl=30 * DAY),
+        scraper_id=SCRAPER_ID,
+    )
+    # claim and snippet embeddings: a re-run with another SIMILARITY_THRESHOLD or
+    # TOP_N only reads vectors back and never loads the model. Each backend keeps
+    # its own vectors, they are close but not identical
+    embedding_store = EmbeddingStore(
+        os.path.join(CACHE_DIR, "embeddings"),
+        f"{DEFAULT_MODEL_NAME}-{select_backend()}",
+        dtype=os.getenv("EMBEDDING_STORE_DTYPE", "float16"),
+    )
+    # claims scored at the same time share model batches; the backend (torch or
+    # torch-int8) and thread count come from EMBEDDING_BACKEND and
+    # EMBEDDING_THREADS
+    embedding_batcher = EmbeddingBatcher(store=embedding_store, scraper_id=SCRAPER_ID)
+    robots_cache = RobotsCache(
+        store=CacheStore(os.path.join(CACHE_DIR, "robots.sqlite"), ttl=DAY)
+    )
+    scheduler = HostScheduler(
+        policy=HostPolicy(rate=2.0, burst=2, max_in_flight=2),
+        max_in_flight=CONCURRENCY_LIMITS.requests,
+        # the search API is not a crawled site and is paced by our plan instead
+        host_policies={
+            "api.scaleserp.com": HostPolicy(rate=20.0, burst=20, max_in_flight=16)
+        },
+    )
+    httpx_client = ScraperClient(
+        scraper_id=SCRAPER_ID,
+        cache=http_cache,
+        robots_cache=robots_cache,
+        scheduler=scheduler,
+        profile=CrawlProfile(
+            max_connections=CONCURRENCY_LIMITS.requests * 2,
+            # the search API is hit throughout the run, crawled hosts rarely twice
+            host_max_idle={"api.scaleserp.com": 16},
+        ),
+    )
+    extraction_executor = ExtractionExecutor(cache=text_cache)
+    article_registry = ArticleRegistry(scraper_id=SCRAPER_ID)
+    fetch_cascade = FetchCascade(
+        direct=fetch_direct,
+        paid=fetch_cached_copy,
+        policy=PaidFetchPolicy(
+            hedge_delay=float(os.getenv("PAID_FETCH_HEDGE_DELAY", 5)),
+            max_share=float(os.getenv("PAID_FETCH_MAX_SHARE", 0.25)),
+        ),
+        scraper_id=SCRAPER_ID,
+    )
+
 async def call_search_api(query: str):
     params = {
         "api_key": SCALESERP_KEY,
@@ -45,136 +169,19 @@ async def call_search_api(query: str):
         "page": 1, # page number
         "num": 30, # results to shows on each page
     }
-    api_result = requests.get('https://api.scaleserp.com/search', params)
-    #try:
-    #    api_result = await httpx_client.get(
-    #        "https://api.scaleserp.com/search", params=params
-    #    )
-    #    logging.info(f"search for {query}") #logger
-    #    return api_result
-    #except Exception as ex:
-    #    logging.info(f"[httpx_error] {repr(ex)}") #logger
-    return api_result
-
-def get_snippets(response):
-    query = get_maybe(["search_parameters", "q"], response)
-    if not query.success:
-        logging.info("ERROR getting snippets")
-        return []
-    snippets = []
-    for item in response.get("organic_results", []):
-        snippet = item.get("snippet")
-        title = item.get("title")
-        link = item.get("link")
-        if snippet:
-            # check if the title is cut
-            if title and title.endswith("..."):
-                full_title = get_full_title(link)
-                if full_title:
-                    title = full_title
-            snippets.append(
-                dict(
-                    snippet=snippet,
-                    link=link,
-                    title=title,
-                    date=item.get("date"), #
-                    domain=item.get("domain"), #
-                    query=query.value,
-                    src="organic_results",
-                )
-            )
+    return await search_cache.get_or_fetch(
+        query, params, lambda: fetch_search_results(query, params)
+    )
 
-        for nr in get_maybe(["nested_results"], item, []).value:
-            snippet = nr.get("snippet")
-            title = item.get("title")
-            link = nr.get("link")
-
-            if snippet:
-                # check if the title is cut
-                if title and title.endswith("..."):
-                    full_title = get_full_title(link)
-                    if full_title:
-                        title = full_title
-                snippets.append(
-                    dict(
-                        snippet=snippet,
-                        link=link,
-                        title=title,
-                        date=item.get("date"), #
-                        domain=item.get("domain"), #
-                        query=query.value,
-                        src="nested_results",
-                    )
-                )
-        snippet = get_maybe(["rich_snippet", "top", "extensions"], item)
-        if snippet.success:
-            title = item.get("title")
-            link = item.get("link")
-
-            # check if the title is cut
-            if title and title.endswith("..."):
-                full_title = get_full_title(link)
-                if full_title:
-                    title = full_title
-            snippets.append(
-                dict(
-                    snippet=" ".join(snippet.value),
-                    link=link,
-                    title=title,
-                    date=item.get("date"), #
-                    domain=item.get("domain"), #
-                    query=query.value,
-                    src="rich_snippet/extensions",
-                )
-            )
-
-        snippet = get_maybe(["rich_snippet", "top", "attributes_flat"], item)
-        if snippet.success:
-            title = item.get("title")
-            link = item.get("link")
-
-             # check if the title is cut
-            if title and title.endswith("..."):
-                full_title = get_full_title(link)
-                if full_title:
-                    title = full_title
-            snippets.append(
-                dict(
-                    snippet=item["rich_snippet"]["top"]["attributes_flat"],
-                    link=link,
-                    title=title,
-                    date=item.get("date"), #
-                    domain=item.get("domain"), #
-                    #title=query.value,
-                    query=query.value,
-                    src="rich_snippet/attributes_flat",
-                )
-            )
-
-            for faq_item in get_maybe(["faq"], item, []).value:
-                snippet = get_maybe(["answer"], faq_item)
-                title = item.get("title")
-                link = item.get("link")
-
-                if snippet.success:
-                    # check if the title is cut
-                    if title and title.endswith("..."):
-                        full_title = get_full_title(link)
-                        if full_title:
-                            title = full_title
-                    snippets.append(
-                        dict(
-                            snippet=snippet.value,
-                            link=link,
-                            title=title,
-                            date=item.get("date"), #
-                            domain=item.get("domain"), #
-                            #title=query.value,
-                            query=query.value,
-                            src="faq",
-                        )
-                    )
-    return snippets
+async def fetch_search_results(query: str, params: dict):
+    try:
+        api_result = await httpx_client.get(
+            "https://api.scaleserp.com/search", params=params, timeout=50
+        )
+        logging.info(f"search for {query}")
+        return api_result.json()
+    except Exception as ex:
+        logging.info(f"[httpx_error] {repr(ex)}")
 
 async def scaleserp_download(url: str):
     encoded_url = urllib.parse.quote(url, safe="")
@@ -188,84 +195,95 @@ async def scaleserp_download(url: str):
         api_result = await httpx_client.get(
             "https://api.scaleserp.com/search", params=params, timeout=50
         )
+        # failures are answered in JSON, with request_info saying why
+        result = {}
+        if "json" in api_result.headers.get("content-type", ""):
+            result = api_result.json()
+        if api_result.status_code != 200 or not get_success(result):
+            logging.info(
+                f"[scaleserp] failed cache:{url} {api_result.status_code} "
+                f"{result.get('request_info')}"
+            )
+            return None
         logging.info(f"[scaleserp] success cache:{url}")
         return api_result.text
     except Exception as ex:
         logging.info(f"[scaleserp] error {repr(ex)}")
 
+async def fetch_direct(url: str, on_sent, on_headers):
+    return await httpx_client.get_page(
+        url, timeout=50, on_sent=on_sent, on_headers=on_headers
+    )
+
+async def fetch_cached_copy(url: str):
+    page_html = await scaleserp_download(url)
+    if not page_html:
+        return None
+    page = Page(
+        url=url,
+        status_code=200,
+        headers={"content-type": "text/html; charset=utf-8"},
+        content=page_html.encode("utf-8"),
+    )
+    # keep the paid copy so reruns do not pay for it again
+    await asyncio.to_thread(http_cache.set, page)
+    return page
+
+async def load_article(link: str, pipeline: ClaimPipeline):
+    page_html = ""
+    async with pipeline.request_slot(link):
+        try:
+            page = await fetch_cascade.fetch(link)
+            if page is not None:
+                page_html = page.text
+        except PageRejectedError as ex:
+            # not an HTML document (or far too large): a cached copy would
+            # not be any better
+            logging.info(f"[fetch] skipped {ex}")
+    if not page_html:
+        return None
+    extraction = await extraction_executor.extract(page_html, link)
+    return extraction.sentences or None
+
+async def process_snippet(index, snippet, pipeline: ClaimPipeline):
+    # fact-check pages come up for many claims: fetch and extract them once
+    sentences = await article_registry.get(
+        snippet["link"], lambda: load_article(snippet["link"], pipeline)
+    )
+    if sentences:
+        snippet["article"] = sentences
+    else:
+        logging.info(f"No article body found for snippet {index}")
+
 # import claim dataset
-async def process_claim(claim, label, source, posted, claim_id):
+async def process_claim(claim, label, source, posted, claim_id, pipeline: ClaimPipeline):
     '''
     output ideal format output file: example at ./output/exp_request_output.json
     add the api search result directly to the json together with the metadata of the claim
     '''
-    nltk.data.path.append(os.path.expanduser('~/nltk_data'))
-
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    query_embedding = model.encode(claim, convert_to_tensor=True)
-    
-    api_result = await call_search_api(claim)
+    response_json = await call_search_api(claim)
     all_snippets = []
-    if api_result:
-        try:
-            response_json = api_result.json()
-        except Exception as ex:
-            logging.info(f"Error parsing JSON response: {repr(ex)}")
-        else:
-            snippets = get_snippets(response_json)
-            all_snippets.extend(snippets)
+    if response_json:
+        # dedupe first so no page is fetched for a snippet that gets dropped
+        all_snippets = dedupe_snippets(parse_serp(response_json).snippets)
     else:
         logging.info("No results returned from API")
 
-    all_snippets = remove_duplicates(all_snippets)
-
-    for snippet in all_snippets:
-        title_embedding = model.encode(snippet["title"], convert_to_tensor=True)
-        relevancy = util.pytorch_cos_sim(query_embedding, title_embedding).item()
-        snippet["relevancy"] = relevancy
-
-    relevant_snippets = [s for s in all_snippets if s["relevancy"] >= SIMILARITY_THRESHOLD]
-    relevant_snippets = sorted(relevant_snippets, key=lambda x: x["relevancy"], reverse=True)[:TOP_N]
-
-    for index, snippet in enumerate(relevant_snippets):
-        page_html = ""
-        article_text = ""
-        try:
-            response = await httpx_client.get(snippet["link"], timeout=50)
-            page_html = response.text
-        except Exception as e:
-            page_html = await scaleserp_download(snippet["link"])
-        if page_html:
-            # delphai ml utils
-            extracted_text = get_text_from_html(page_html)
-            # trafilatura
-            if not extracted_text:
-                extracted_text = trafilatura.extract(page_html)
-            if not extracted_text:
-                # newspaper3k
-                article = Article(snippet["link"])
-                article.set_html(page_html)
-                article.parse()
-                extracted_text = article.text
-            if not extracted_text:
-                # BeautifulSoup
-                soup = BeautifulSoup(page_html, 'html.parser')
-                article_body = soup.find('body')
-                if article_body:
-                    paragraphs = article_body.find_all('p')
-                    extracted_text = "\n".join([p.get_text() for p in paragraphs])
-            if extracted_text: 
-                #print(len(extracted_text))
-                tokenized_sentences = sent_tokenize(extracted_text)
-                snippet["article"] = tokenized_sentences
-
-                #with open(f"article_{index}.html", "w", encoding="utf-8") as file:
-                #    file.write("<html><body>")
-                #    file.write(extracted_text.replace("\n", "<br>"))
-                #    file.write("</body></html>")
-                #    logging.info(f"Saved article {index} to article_{index}.html")
-            else:
-                logging.info(f"No article body found for snippet {index}")
+    # title and snippet text are scored together, so a title cut off with
+    # "..." only matters when the snippet is on the threshold
+    relevant_snippets = await rank_snippets_async(
+        claim, all_snippets, SIMILARITY_THRESHOLD, TOP_N, embedding_batcher
+    )
+    boundary = near_threshold(all_snippets, SIMILARITY_THRESHOLD, TITLE_MARGIN)
+    if boundary:
+        await resolve_full_titles(httpx_client, boundary)
+        await score_snippets_async([claim], [boundary], embedding_batcher)
+        relevant_snippets = select_relevant(all_snippets, SIMILARITY_THRESHOLD, TOP_N)
+
+    await pipeline.map_links(
+        list(enumerate(relevant_snippets)),
+        lambda item: process_snippet(*item, pipeline),
+    )
 
     return {
         "claim": claim,
@@ -273,12 +291,12 @@ async def process_claim(claim, label, source, posted, claim_id):
         "source": source,
         "posted": posted,
         "claim_id": claim_id,
-        "api_result": relevant_snippets
+        "api_result": [snippet.to_dict() for snippet in relevant_snippets]
     }
 
 async def main():
-    df = pd.read_csv('./claim_dataset.csv')
-    claims = df.to_dict(orient='records')[0:3] #set mini size for testing
+    if not len(embedding_store):
+        warm_up()
     testing_query = [
         'Wheaties cereal sticks to magnets because it has metal flakes', 
         'Farmers feed their cattle candy, such as Skittles',
@@ -286,22 +304,56 @@ async def main():
         ' Kraft Macaroni & Cheese products carry a warning label due to their use of GMO wheat',
         'A photograph shows Barack Obama sitting with Malcolm X and Martin Luther King, Jr.'
         ]
-    results = []
-    for claim in claims:
-        result = await process_claim(
+    pipeline = ClaimPipeline(CONCURRENCY_LIMITS)
+
+    def run_claim(claim):
+        return process_claim(
             claim["claim"],
             claim["label"],
             claim["source"],
             claim["posted"],
-            claim["claim_id"]
+            claim["claim_id"],
+            pipeline,
         )
-        results.append(result)
-    
-    with open("./output/exp_request_output.json", "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=4)
+
+    with JsonlWriter(OUTPUT_PATH) as writer:
+        if WORK_QUEUE:
+            queue = open_queue(WORK_QUEUE, max_attempts=int(os.getenv("MAX_ATTEMPTS", 3)))
+            await QueueWorker(
+                queue,
+                pipeline,
+                writer,
+                visibility_timeout=float(os.getenv("VISIBILITY_TIMEOUT", 300)),
+            ).run(run_claim)
+        else:
+            # claims finished by an earlier run are not scraped again
+            claims = (
+                claim
+                async for claim in CLAIM_SOURCE
+                if not writer.is_done(claim["claim_id"])
+            )
+            async for result in pipeline.run(claims, run_claim):
+                await asyncio.to_thread(writer.write, result)
+
+    extraction_executor.shutdown()
+    logging.info(f"[transport] {httpx_client.pool_stats()}")
+
+    if not WORK_QUEUE and NUM_SHARDS == 1:
+        convert_to_json(OUTPUT_PATH, "./output/exp_request_output.json")
+
+async def enqueue():
+    queue = open_queue(WORK_QUEUE)
+    added = await fill_queue(queue, CLAIM_SOURCE)
+    logging.info(f"[queue] added {added} claims, {await queue.counts()}")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # `python draft.py enqueue` fills WORK_QUEUE from the claim source once,
+    # then every node runs `python draft.py`
+    if sys.argv[1:] == ["enqueue"]:
+        asyncio.run(enqueue())
+    else:
+        setup()
+        asyncio.run(main())
 
 
 # the following output the api search result
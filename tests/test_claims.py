@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("pandas")
+
+from delphai_scraper_utils.claims import ClaimSource, detect_format  # noqa: E402
+
+ROWS = [
+    {
+        "claim": f"claim {number}",
+        "label": number % 2 == 0,
+        "source": "snopes" if number % 3 else "politifact",
+        "posted": "",
+        "claim_id": f"c{number:02d}",
+    }
+    for number in range(25)
+]
+
+
+@pytest.fixture(params=["csv", "jsonl"])
+def claim_file(request, tmp_path):
+    path = tmp_path / f"claims.{request.param}"
+    if request.param == "csv":
+        lines = ["claim,label,source,posted,claim_id"] + [
+            f"{row['claim']},{str(row['label']).lower()},{row['source']},,"
+            f"{row['claim_id']}"
+            for row in ROWS
+        ]
+        # the dataset is saved with a byte order mark
+        path.write_text("\ufeff" + "\n".join(lines) + "\n", encoding="utf-8")
+    else:
+        path.write_text(
+            "".join(json.dumps(row) + "\n" for row in ROWS), encoding="utf-8"
+        )
+    return str(path)
+
+
+def ids(claims):
+    return [claim["claim_id"] for claim in claims]
+
+
+def test_detect_format():
+    assert detect_format("claims.CSV") == "csv"
+    assert detect_format("claims.jsonl.gz") == "jsonl"
+    with pytest.raises(ValueError):
+        detect_format("claims.txt")
+
+
+def test_row_range_spans_chunks(claim_file):
+    source = ClaimSource(claim_file, chunk_size=4, start=3, stop=13)
+    assert ids(source) == [row["claim_id"] for row in ROWS[3:13]]
+
+
+def test_source_and_label_filters(claim_file):
+    source = ClaimSource(claim_file, chunk_size=7, sources=["snopes"], labels=["False"])
+    assert ids(source) == [
+        row["claim_id"]
+        for row in ROWS
+        if row["source"] == "snopes" and not row["label"]
+    ]
+
+
+def test_shards_partition_the_claims(claim_file):
+    shards = [
+        ids(ClaimSource(claim_file, chunk_size=6, shard=shard, num_shards=3))
+        for shard in range(3)
+    ]
+    assert sorted(sum(shards, [])) == [row["claim_id"] for row in ROWS]
+    assert all(shards)
+    with pytest.raises(ValueError):
+        ClaimSource(claim_file, shard=3, num_shards=3)
+
+
+def test_async_iteration_matches_sync(claim_file):
+    source = ClaimSource(claim_file, chunk_size=5, start=2)
+
+    async def collect():
+        return [claim async for claim in source]
+
+    assert ids(asyncio.run(collect())) == ids(source)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from delphai_scraper_utils.embeddings import get_model  # noqa: E402
+from delphai_scraper_utils.relevancy import score_batch, select_top  # noqa: E402
+
+# draft.py
+SIMILARITY_THRESHOLD = 0.6
+TOP_N = 15
+TOLERANCE = 0.02
+
+CLAIMS = [
+    (
+        "The Eiffel Tower was completed in 1889",
+        [
+            "Eiffel Tower construction finished in March 1889",
+            "The Eiffel Tower opened for the 1889 World's Fair in Paris",
+            "History of the Eiffel Tower, built between 1887 and 1889",
+            "Paris hotels with a view of the Eiffel Tower",
+            "How tall is the Eiffel Tower?",
+            "Stock market closes higher on tech earnings",
+        ],
+    ),
+    (
+        "Drinking coffee reduces the risk of type 2 diabetes",
+        [
+            "Coffee consumption linked to lower type 2 diabetes risk",
+            "Study: regular coffee drinkers less likely to develop diabetes",
+            "Does coffee lower your chance of getting diabetes?",
+            "The best espresso machines of the year",
+            "Type 2 diabetes: symptoms and causes",
+            "Local team wins the championship after extra time",
+        ],
+    ),
+]
+
+
+@pytest.fixture(scope="module")
+def models():
+    try:
+        return {
+            backend: get_model(device="cpu", backend=backend)
+            for backend in ("torch", "torch-int8")
+        }
+    except OSError as ex:
+        pytest.skip(f"embedding model not available: {ex}")
+
+
+def test_int8_scores_match_torch(models):
+    queries = [claim for claim, _ in CLAIMS]
+    titles = [titles for _, titles in CLAIMS]
+    reference = score_batch(queries, titles, model=models["torch"])
+    quantised = score_batch(queries, titles, model=models["torch-int8"])
+
+    for ours, theirs in zip(quantised, reference):
+        assert np.abs(ours - theirs).max() <= TOLERANCE
+        # titles within the tolerance of the threshold may land on either side
+        settled = set(np.flatnonzero(np.abs(theirs - SIMILARITY_THRESHOLD) > TOLERANCE))
+        ours_top = set(select_top(ours, SIMILARITY_THRESHOLD, TOP_N).tolist())
+        theirs_top = set(select_top(theirs, SIMILARITY_THRESHOLD, TOP_N).tolist())
+        assert ours_top & settled == theirs_top & settled
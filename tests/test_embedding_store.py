@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from delphai_scraper_utils.embedding_store import EmbeddingStore
+from delphai_scraper_utils.relevancy import encode_unique
+
+DIMENSION = 8
+
+
+class FakeModel:
+    """
+    Deterministic unit vectors per text, counting what it is asked to encode
+    """
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, **kwargs):
+        self.encoded.extend(texts)
+        return np.stack([self.vector(text) for text in texts])
+
+    @staticmethod
+    def vector(text):
+        generator = np.random.default_rng(sum(text.encode()))
+        vector = generator.normal(size=DIMENSION).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def get_sentence_embedding_dimension(self):
+        return DIMENSION
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_reopened_store_needs_no_model(tmp_path, dtype):
+    texts = ["alpha", "beta", "gamma", "alpha"]
+    first = encode_unique(
+        texts, model=FakeModel(), store=EmbeddingStore(tmp_path, "m", dtype)
+    )
+
+    model = FakeModel()
+    again = encode_unique(
+        texts, model=model, store=EmbeddingStore(tmp_path, "m", dtype)
+    )
+    assert model.encoded == []
+    np.testing.assert_allclose(again, first, atol=0.02)
+
+
+def test_store_opened_before_another_instance_writes(tmp_path):
+    reader = EmbeddingStore(tmp_path, "m")
+    writer = EmbeddingStore(tmp_path, "m")
+    writer.put_many(["alpha"], FakeModel.vector("alpha")[None, :])
+
+    model = FakeModel()
+    texts = ["gamma", "alpha", "delta", "alpha"]
+    embeddings = encode_unique(texts, model=model, store=reader)
+
+    assert model.encoded == ["gamma", "delta"]
+    assert embeddings.shape == (len(texts), DIMENSION)
+    for text, embedding in zip(texts, embeddings):
+        np.testing.assert_allclose(embedding, FakeModel.vector(text), atol=0.01)
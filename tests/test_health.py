@@ -0,0 +1,117 @@
+import asyncio
+
+import httpx
+import pytest
+
+from delphai_scraper_utils.client import ScraperClient
+from delphai_scraper_utils.health import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    BreakerPolicy,
+    CircuitBreaker,
+    CircuitOpenError,
+    HostHealth,
+    RetryBudget,
+)
+
+URL = "https://example.com/page"
+
+
+def test_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker("example.com", BreakerPolicy(failure_threshold=2))
+    assert breaker.before_call() is False
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.opened_at -= breaker.policy.reset_timeout
+    assert breaker.before_call() is True
+    assert breaker.state == HALF_OPEN
+    # one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("example.com", BreakerPolicy(failure_threshold=1))
+    breaker.record_failure()
+    breaker.opened_at -= breaker.policy.reset_timeout
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def half_open_client(handler):
+    host_health = HostHealth(policy=BreakerPolicy(failure_threshold=1))
+    breaker = host_health.breaker("example.com")
+    breaker.record_failure()
+    breaker.opened_at -= breaker.policy.reset_timeout
+    client = ScraperClient(
+        transport=httpx.MockTransport(handler),
+        ignore_robots_txt=True,
+        host_health=host_health,
+        hedge_requests=False,
+        max_retry_attempts=1,
+    )
+    return client, breaker
+
+
+def test_cancelled_probe_releases_its_slot():
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+        return httpx.Response(200, text="ok")
+
+    async def run():
+        client, breaker = half_open_client(handler)
+        probe = asyncio.ensure_future(client.get(URL))
+        await asyncio.sleep(0.01)
+        assert breaker.probes == 1
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        release.set()
+        response = await client.get(URL)
+        assert response.status_code == 200
+        assert breaker.state == CLOSED
+
+    asyncio.run(run())
+
+
+def test_probe_failing_outside_the_failure_types_releases_its_slot():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise ValueError("not about the host")
+        return httpx.Response(200, text="ok")
+
+    async def run():
+        client, breaker = half_open_client(handler)
+        with pytest.raises(ValueError):
+            await client.get(URL)
+        assert breaker.state == HALF_OPEN
+        response = await client.get(URL)
+        assert response.status_code == 200
+        assert breaker.state == CLOSED
+
+    asyncio.run(run())
+
+
+def test_retry_budget_caps_retries_at_ratio_of_requests():
+    budget = RetryBudget(ratio=0.5, window=60.0, min_retries=1)
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    for _ in range(6):
+        budget.record_request()
+    assert sum(budget.try_spend() for _ in range(10)) == 2
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from delphai_scraper_utils.health import CircuitOpenError
+from delphai_scraper_utils.robots import RobotsCache
+
+URL = "https://example.com/news/article"
+
+
+class Fetcher:
+    """
+    Answers robots.txt requests from a list of responses or exceptions
+    """
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def __call__(self, robots_text_url):
+        outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+        self.calls += 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def lookup(cache, fetch, url=URL):
+    return asyncio.run(cache.get(url, fetch))
+
+
+def expire(cache, seconds):
+    for entry in cache._entries.values():
+        entry.fetched_at -= seconds
+
+
+def test_rules_are_parsed_and_cached():
+    cache = RobotsCache()
+    fetch = Fetcher((200, "User-agent: *\nDisallow: /news/\nCrawl-delay: 2"))
+    entry = lookup(cache, fetch)
+    assert not entry.can_fetch(URL, "bot")
+    assert entry.can_fetch("https://example.com/about", "bot")
+    assert entry.crawl_delay("bot") == 2.0
+    lookup(cache, fetch)
+    assert fetch.calls == 1
+
+
+@pytest.mark.parametrize("status_code", [401, 403, 404, 410])
+def test_4xx_allows_everything_for_the_full_ttl(status_code):
+    cache = RobotsCache(failure_ttl=10, error_ttl=1)
+    fetch = Fetcher((status_code, ""))
+    assert lookup(cache, fetch).can_fetch(URL, "bot")
+    expire(cache, 60)
+    lookup(cache, fetch)
+    assert fetch.calls == 1
+
+
+@pytest.mark.parametrize("status_code", [500, 503])
+def test_5xx_disallows_until_the_failure_ttl(status_code):
+    cache = RobotsCache(failure_ttl=10, error_ttl=1)
+    fetch = Fetcher((status_code, ""), (404, ""))
+    assert not lookup(cache, fetch).can_fetch(URL, "bot")
+    expire(cache, 5)
+    assert not lookup(cache, fetch).can_fetch(URL, "bot")
+    assert fetch.calls == 1
+    expire(cache, 10)
+    assert lookup(cache, fetch).can_fetch(URL, "bot")
+    assert fetch.calls == 2
+
+
+def test_fetch_error_disallows_only_for_the_error_ttl():
+    cache = RobotsCache(failure_ttl=10, error_ttl=1)
+    fetch = Fetcher(TimeoutError(), (404, ""))
+    assert not lookup(cache, fetch).can_fetch(URL, "bot")
+    lookup(cache, fetch)
+    assert fetch.calls == 1
+    expire(cache, 2)
+    assert lookup(cache, fetch).can_fetch(URL, "bot")
+    assert fetch.calls == 2
+
+
+def test_open_circuit_is_raised_and_not_cached():
+    cache = RobotsCache()
+    fetch = Fetcher(CircuitOpenError("example.com", 30.0), (404, ""))
+    with pytest.raises(CircuitOpenError):
+        lookup(cache, fetch)
+    assert lookup(cache, fetch).can_fetch(URL, "bot")
+    assert fetch.calls == 2
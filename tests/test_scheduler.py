@@ -0,0 +1,107 @@
+import asyncio
+from time import monotonic
+
+import pytest
+
+from delphai_scraper_utils.scheduler import HostPolicy, HostScheduler, parse_retry_after
+
+FAST = HostPolicy(rate=1000.0, burst=1000, max_in_flight=100)
+
+
+async def grant_times(scheduler, host, count):
+    started = monotonic()
+    times = []
+    for _ in range(count):
+        await scheduler.acquire(host)
+        times.append(monotonic() - started)
+        scheduler.release(host)
+    return times
+
+
+def test_burst_is_immediate_then_rate_applies():
+    scheduler = HostScheduler(policy=HostPolicy(rate=20.0, burst=2))
+    times = asyncio.run(grant_times(scheduler, "example.com", 4))
+    assert times[1] < 0.02
+    assert times[2] >= 0.04
+    assert times[3] >= 0.09
+
+
+def test_crawl_delay_lowers_rate_and_burst():
+    scheduler = HostScheduler(policy=HostPolicy(rate=100.0, burst=10))
+    scheduler.set_crawl_delay("example.com", 0.05)
+    times = asyncio.run(grant_times(scheduler, "example.com", 3))
+    assert times[1] >= 0.04
+    assert times[2] >= 0.09
+
+
+def test_back_off_holds_the_host():
+    scheduler = HostScheduler(policy=FAST)
+    scheduler.back_off("example.com", 0.05)
+    times = asyncio.run(grant_times(scheduler, "example.com", 1))
+    assert times[0] >= 0.045
+
+
+def test_in_flight_cap_per_host():
+    scheduler = HostScheduler(policy=HostPolicy(rate=1000.0, burst=10, max_in_flight=1))
+
+    async def run():
+        await scheduler.acquire("example.com")
+        second = asyncio.ensure_future(scheduler.acquire("example.com"))
+        await asyncio.sleep(0.01)
+        assert not second.done()
+        scheduler.release("example.com")
+        await asyncio.wait_for(second, 1)
+
+    asyncio.run(run())
+
+
+def test_free_slots_go_round_robin_across_hosts():
+    scheduler = HostScheduler(policy=FAST, max_in_flight=1)
+    granted = []
+
+    async def request(host):
+        async with scheduler.slot(f"https://{host}/"):
+            granted.append(host)
+            await asyncio.sleep(0)
+
+    async def run():
+        await scheduler.acquire("busy.com")
+        tasks = [
+            asyncio.ensure_future(request(host))
+            for host in ["busy.com", "busy.com", "busy.com", "quiet.com"]
+        ]
+        await asyncio.sleep(0)
+        scheduler.release("busy.com")
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert granted.index("quiet.com") <= 1
+
+
+def test_cancelled_waiter_does_not_keep_a_slot():
+    scheduler = HostScheduler(policy=FAST, max_in_flight=1)
+
+    async def run():
+        await scheduler.acquire("example.com")
+        waiter = asyncio.ensure_future(scheduler.acquire("example.com"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        scheduler.release("example.com")
+        await asyncio.wait_for(scheduler.acquire("other.com"), 1)
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("120", 120.0),
+        (None, None),
+        ("soon", None),
+        ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),
+    ],
+)
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
@@ -0,0 +1,54 @@
+import asyncio
+
+from delphai_scraper_utils.page import Page
+from delphai_scraper_utils.strategy import FetchCascade, PaidFetchPolicy
+
+URL = "https://example.com/article"
+
+
+def page(body: str) -> Page:
+    return Page(
+        url=URL,
+        status_code=200,
+        headers={"content-type": "text/html"},
+        content=body.encode(),
+    )
+
+
+def cascade(direct, paid_calls):
+    async def paid(url):
+        paid_calls.append(url)
+        await asyncio.sleep(0.5)
+        return page("paid")
+
+    return FetchCascade(direct, paid, PaidFetchPolicy(hedge_delay=0.05))
+
+
+def test_waiting_for_our_scheduler_does_not_trigger_the_paid_fetch():
+    paid_calls = []
+
+    async def direct(url, on_sent, on_headers):
+        # robots.txt and the host's crawl delay
+        await asyncio.sleep(0.2)
+        on_sent()
+        await asyncio.sleep(0.01)
+        on_headers()
+        return page("direct")
+
+    fetched = asyncio.run(cascade(direct, paid_calls).fetch(URL))
+    assert fetched.text == "direct"
+    assert paid_calls == []
+
+
+def test_slow_server_is_hedged_with_the_paid_fetch():
+    paid_calls = []
+
+    async def direct(url, on_sent, on_headers):
+        on_sent()
+        await asyncio.sleep(0.2)
+        on_headers()
+        return page("direct")
+
+    fetched = asyncio.run(cascade(direct, paid_calls).fetch(URL))
+    assert fetched.text == "direct"
+    assert paid_calls == [URL]
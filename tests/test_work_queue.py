@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+from delphai_scraper_utils.output import JsonlWriter, load_checkpoint, read_records
+from delphai_scraper_utils.pipeline import ClaimPipeline, ConcurrencyLimits
+from delphai_scraper_utils.work_queue import (
+    DEAD,
+    DONE,
+    PENDING,
+    QueueWorker,
+    SqliteQueue,
+)
+
+
+def claims(count):
+    return [(str(number), {"claim_id": number}) for number in range(count)]
+
+
+def test_put_many_skips_known_ids(tmp_path):
+    async def run():
+        queue = SqliteQueue(str(tmp_path / "queue.sqlite"))
+        assert await queue.put_many(claims(3)) == 3
+        assert await queue.put_many(claims(5)) == 2
+        assert await queue.counts() == {PENDING: 5}
+
+    asyncio.run(run())
+
+
+def test_leased_task_is_not_handed_out_twice_and_ack_finishes_it(tmp_path):
+    async def run():
+        queue = SqliteQueue(str(tmp_path / "queue.sqlite"))
+        await queue.put_many(claims(2))
+        first = await queue.lease(1, visibility_timeout=60)
+        second = await queue.lease(5, visibility_timeout=60)
+        assert [lease.task_id for lease in first + second] == ["0", "1"]
+        assert await queue.lease(5, visibility_timeout=60) == []
+
+        assert await queue.ack(first[0])
+        assert not await queue.ack(first[0])
+        assert (await queue.counts())[DONE] == 1
+        assert not await queue.is_drained()
+        await queue.ack(second[0])
+        assert await queue.is_drained()
+
+    asyncio.run(run())
+
+
+def test_nack_retries_until_max_attempts(tmp_path):
+    async def run():
+        queue = SqliteQueue(str(tmp_path / "queue.sqlite"), max_attempts=2)
+        await queue.put_many(claims(1))
+        (lease,) = await queue.lease(1, visibility_timeout=60)
+        assert await queue.nack(lease, "boom")
+        (lease,) = await queue.lease(1, visibility_timeout=60)
+        assert lease.attempt == 2
+        await queue.nack(lease, "boom")
+        assert await queue.counts() == {DEAD: 1}
+        assert await queue.lease(1, visibility_timeout=60) == []
+
+    asyncio.run(run())
+
+
+def test_expired_lease_is_handed_out_again(tmp_path):
+    async def run():
+        queue = SqliteQueue(str(tmp_path / "queue.sqlite"))
+        await queue.put_many(claims(1))
+        (expired,) = await queue.lease(1, visibility_timeout=0.01)
+        time.sleep(0.02)
+        (lease,) = await queue.lease(1, visibility_timeout=60)
+        assert lease.attempt == 2
+        # the worker that lost the lease can no longer finish the task
+        assert not await queue.extend(expired, 60)
+        assert not await queue.ack(expired)
+        assert await queue.ack(lease)
+
+    asyncio.run(run())
+
+
+class SlowCheckpoint:
+    """
+    Checkpoint file whose flush takes long enough for other threads to
+    append while JsonlWriter.flush is running
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, text):
+        return self.file.write(text)
+
+    def flush(self):
+        time.sleep(0.005)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def test_worker_checkpoints_every_claim_it_acks(tmp_path):
+    count = 40
+    path = str(tmp_path / "output.jsonl")
+
+    async def process(claim):
+        await asyncio.sleep(0.001 * (claim["claim_id"] % 5))
+        return claim
+
+    async def run():
+        queue = SqliteQueue(str(tmp_path / "queue.sqlite"))
+        await queue.put_many(claims(count))
+        with JsonlWriter(path, flush_every=1000) as writer:
+            writer._checkpoint = SlowCheckpoint(writer._checkpoint)
+            worker = QueueWorker(
+                queue,
+                ClaimPipeline(ConcurrencyLimits(claims=16)),
+                writer,
+                lease_batch=16,
+                poll_interval=0.01,
+            )
+            await worker.run(process)
+        assert await queue.counts() == {DONE: count}
+
+    asyncio.run(run())
+    expected = {str(number) for number in range(count)}
+    assert load_checkpoint(path) == expected
+    assert {str(record["claim_id"]) for record in read_records(path)} == expected
+
+
+def test_writer_resumes_from_its_checkpoint(tmp_path):
+    path = str(tmp_path / "output.jsonl")
+    with JsonlWriter(path) as writer:
+        writer.write({"claim_id": 1, "value": "first"})
+        writer.write({"claim_id": 2, "value": "first"})
+
+    with JsonlWriter(path) as writer:
+        assert writer.is_done(1) and writer.is_done("2")
+        assert not writer.is_done(3)
+        # a record written again after a crash
+        writer.write({"claim_id": 2, "value": "again"})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"claim_id": 3, "val')
+
+    records = list(read_records(path))
+    assert [(record["claim_id"], record["value"]) for record in records] == [
+        (1, "first"),
+        (2, "again"),
+    ]